@@ -0,0 +1,25 @@
+"""
+Image processing engines. All of the decoding, resizing, cropping and
+encoding done for thumbnails goes through an engine, so the imaging library
+can be swapped out via the ``THUMBNAIL_ENGINE`` setting.
+"""
+
+import functools
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Dotted path to the engine class used to process thumbnails.
+THUMBNAIL_ENGINE = getattr(
+    settings, "THUMBNAIL_ENGINE", "athumb.engines.pil.PILEngine"
+)
+
+
+@functools.lru_cache(maxsize=None)
+def get_engine(path=None):
+    """
+    Returns an instance of the engine at the given dotted path, defaulting to
+    the one named by the ``THUMBNAIL_ENGINE`` setting. Engines hold no
+    per-image state, so instances are shared.
+    """
+    return import_string(path or THUMBNAIL_ENGINE)()
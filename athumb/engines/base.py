@@ -0,0 +1,138 @@
+"""
+The engine interface every image processing backend implements.
+"""
+
+from athumb.utils import calc_crop_box, calc_scaled_size
+
+# Images are only pre-reduced when they are at least this many times bigger
+# than needed, which keeps the result indistinguishable from resampling the
+# full-size image. This is the same trick Pillow's thumbnail() uses.
+REDUCING_GAP = 3
+
+
+class BaseEngine(object):
+    """
+    Wraps an imaging library. Engines never modify the image they are given,
+    every operation returns a new (or the same, untouched) image object, so
+    one decoded original can be used for all of a field's thumbnails.
+
+    Subclasses implement the library-specific primitives. The sizing and
+    cropping arithmetic lives here so every engine produces thumbnails of
+    exactly the same dimensions.
+    """
+
+    def open(self, content, max_pixels=None):
+        """
+        Opens the file-like ``content`` and returns an image object. The
+        content belongs to the caller, it must not be closed by the engine.
+
+        Engines with a pixel limit of their own should let images of up to
+        ``max_pixels`` (the field's limit, if it has one) through, and raise
+        UploadedImageTooLargeError for images they refuse to open.
+        """
+        raise NotImplementedError
+
+    def close(self, image):
+        """
+        Releases any resources held by an image returned from open(). Only
+        the engine's own resources are released, the ``content`` that was
+        passed to open() stays open and usable (ie: so the original can still
+        be stored after its header was checked).
+        """
+        pass
+
+    def get_size(self, image):
+        """
+        Returns the (width, height) of the image.
+        """
+        raise NotImplementedError
+
+    def get_decoded_size(self, image):
+        """
+        Returns roughly how many bytes the image takes up once decoded. This
+        must not decode the image.
+        """
+        raise NotImplementedError
+
+    def reduce(self, image, size):
+        """
+        Returns a version of the image that is at least 'size' big, using the
+        cheapest decoding available for the format (ie: JPEG DCT scaling or
+        strip-wise shrinking), and resolves any lazy decoding so the result
+        can be used for several thumbs. The image passed in must not be used
+        afterwards.
+        """
+        return image
+
+    def get_reduce_factor(self, image, size):
+        """
+        Returns the integer factor the image can be reduced by on the way to
+        'size', or 1 if it shouldn't be.
+        """
+        width, height = self.get_size(image)
+        return max(1, min(width // size[0], height // size[1]) // REDUCING_GAP)
+
+    def normalize_colorspace(self, image):
+        """
+        Converts the image to RGB, keeping the alpha channel if there is one.
+        """
+        raise NotImplementedError
+
+    def resize(self, image, size):
+        """
+        Resizes the image to exactly the (width, height) given.
+        """
+        raise NotImplementedError
+
+    def crop_to_box(self, image, box):
+        """
+        Crops the image to the (left, upper, right, lower) box given. Areas of
+        the box outside of the image are filled in, as with PIL.
+        """
+        raise NotImplementedError
+
+    def encode(self, image, file_extension, fileobj):
+        """
+        Encodes the image in the format matching the given file extension
+        (ie: 'jpg', 'png'), writing it straight into the file-like 'fileobj'
+        rather than building up an intermediate bytes object.
+        """
+        raise NotImplementedError
+
+    def scale(
+        self, image, target_size, crop_option=None, upscale=False, source_size=None
+    ):
+        # When the image was reduced, the final size still comes from the
+        # original's so thumbs come out the same either way.
+        size = calc_scaled_size(
+            source_size or self.get_size(image),
+            target_size,
+            crop_option=crop_option,
+            upscale=upscale,
+        )
+        if size != tuple(self.get_size(image)):
+            image = self.resize(image, size)
+        return image
+
+    def crop(self, image, target_size, crop_option="center"):
+        box = calc_crop_box(self.get_size(image), target_size, crop_option=crop_option)
+        return self.crop_to_box(image, box)
+
+    def create_thumbnail(
+        self, image, size, crop_option=None, upscale=False, source_size=None
+    ):
+        """
+        Runs the full thumbnailing pipeline on an opened image. Pass the
+        original's 'source_size' if the image was reduce()'d.
+        """
+        image = self.normalize_colorspace(image)
+        image = self.scale(
+            image,
+            size,
+            crop_option=crop_option,
+            upscale=upscale,
+            source_size=source_size,
+        )
+        if crop_option:
+            image = self.crop(image, size, crop_option=crop_option)
+        return image
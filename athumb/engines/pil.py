@@ -0,0 +1,107 @@
+"""
+The default engine, backed by Pillow.
+"""
+
+import threading
+
+from PIL import Image, ImageMode
+
+from athumb.engines.base import REDUCING_GAP, BaseEngine
+from athumb.exceptions import UploadedImageTooLargeError
+from athumb.utils import convert_colorspace
+
+# Modes Image.reduce() can work on directly. Anything else (ie: palette and
+# bilevel images) is converted with normalize_colorspace() first.
+REDUCE_MODES = ("L", "LA", "RGB", "RGBA", "CMYK", "I", "F")
+
+# Held while opening images, see PILEngine.open().
+MAX_IMAGE_PIXELS_LOCK = threading.Lock()
+
+
+class NonClosingFile(object):
+    """
+    Wraps a file-like object so Pillow can't close it. Closing an image
+    opened from a file also closes the file, but the content engines open
+    belongs to the caller.
+    """
+
+    def __init__(self, file):
+        self.file = file
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def close(self):
+        pass
+
+
+class PILEngine(BaseEngine):
+    def __init__(self):
+        # Map file extensions (ie: 'jpg') to Pillow format names (ie: 'JPEG')
+        # once, rather than working it out for every thumb.
+        self.formats = {
+            extension.lstrip("."): pil_format
+            for extension, pil_format in Image.registered_extensions().items()
+        }
+
+    def open(self, content, max_pixels=None):
+        content = NonClosingFile(content)
+        # Pillow's decompression bomb limit is global. Every open holds the
+        # lock, so no image is ever opened under another field's limit.
+        with MAX_IMAGE_PIXELS_LOCK:
+            default_max_pixels = Image.MAX_IMAGE_PIXELS
+            if max_pixels and default_max_pixels and max_pixels > default_max_pixels:
+                # The field allows bigger images than Pillow does by default.
+                Image.MAX_IMAGE_PIXELS = max_pixels
+            try:
+                return Image.open(content)
+            except Image.DecompressionBombError:
+                raise UploadedImageTooLargeError(
+                    "The uploaded image is too large. Please upload a smaller image."
+                )
+            finally:
+                Image.MAX_IMAGE_PIXELS = default_max_pixels
+
+    def close(self, image):
+        image.close()
+
+    def get_size(self, image):
+        return image.size
+
+    def get_decoded_size(self, image):
+        mode = ImageMode.getmode(image.mode)
+        bands = len(mode.bands)
+        # Pillow pads 3-band images out to 4 bytes per pixel.
+        if bands == 3:
+            bands = 4
+        width, height = image.size
+        return width * height * bands * int(mode.typestr[-1])
+
+    def reduce(self, image, size):
+        factor = self.get_reduce_factor(image, size)
+        if factor == 1:
+            return image
+        # For JPEGs, have the decoder scale down while decoding, so the full
+        # size image is never held in memory.
+        image.draft(None, tuple(dim * REDUCING_GAP for dim in size))
+        factor = self.get_reduce_factor(image, size)
+        if factor == 1:
+            return image
+        source = image
+        if image.mode not in REDUCE_MODES:
+            image = self.normalize_colorspace(image)
+        reduced = image.reduce(factor)
+        source.close()
+        return reduced
+
+    def normalize_colorspace(self, image):
+        return convert_colorspace(image, colorspace="RGB")
+
+    def resize(self, image, size):
+        return image.resize(size, resample=Image.Resampling.LANCZOS)
+
+    def crop_to_box(self, image, box):
+        return image.crop(box)
+
+    def encode(self, image, file_extension, fileobj):
+        image.save(fileobj, format=self.formats.get(file_extension, file_extension))
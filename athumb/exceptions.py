@@ -14,9 +14,26 @@ class UploadedImageIsUnreadableError(Exception):
     pass
 
 
+class UploadedImageTooLargeError(UploadedImageIsUnreadableError):
+    """
+    Raised when an uploaded image is bigger than the field's max_image_pixels
+    or max_decoded_bytes allow. This is checked before the image is decoded.
+    """
+
+    pass
+
+
 class ThumbnailError(Exception):
     pass
 
 
 class ThumbnailParseError(ThumbnailError):
     pass
+
+
+class ThumbnailSpecError(ThumbnailError):
+    """
+    Raised when an entry in a field's ``thumbs`` is malformed.
+    """
+
+    pass
@@ -3,16 +3,28 @@
 Fields, FieldFiles, and Validators.
 """
 
-import os
+import hashlib
 import io
+import mimetypes
+import os
+import tempfile
+from collections import namedtuple
 
-from PIL import Image
+from django.core import checks
+from django.core.exceptions import FieldDoesNotExist
 from django.db.models import ImageField
 from django.db.models.fields.files import ImageFieldFile
 from django.conf import settings
 from django.core.cache import cache
-from django.core.files.base import ContentFile
-from .exceptions import UploadedImageIsUnreadableError
+from django.core.files.base import File
+from .engines import get_engine
+from .exceptions import (
+    ThumbnailSpecError,
+    UploadedImageIsUnreadableError,
+    UploadedImageTooLargeError,
+)
+from .specs import ThumbSpec, compile_thumb_specs
+from .utils import calc_scaled_size, calc_thumbnail_size
 
 from .validators import ImageUploadExtensionValidator
 
@@ -21,6 +33,44 @@ from .validators import ImageUploadExtensionValidator
 THUMBNAIL_URL_CACHE_TIME = getattr(settings, "THUMBNAIL_URL_CACHE_TIME", 3600 * 24)
 # Optional cache-buster string to append to end of thumbnail URLs.
 MEDIA_CACHE_BUSTER = getattr(settings, "MEDIA_CACHE_BUSTER", "")
+# Encoded thumbnails bigger than this many bytes are moved to a temporary file
+# on disk instead of being held in memory on their way to the storage.
+THUMBNAIL_SPOOL_MAX_SIZE = getattr(
+    settings, "THUMBNAIL_SPOOL_MAX_SIZE", settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+)
+# Cache-Control sent with thumbs on fields with hashed_thumbnails. Their
+# filenames change whenever their content does, so they can be cached forever.
+THUMBNAIL_IMMUTABLE_CACHE_CONTROL = getattr(
+    settings,
+    "THUMBNAIL_IMMUTABLE_CACHE_CONTROL",
+    "public, max-age=31536000, immutable",
+)
+# Number of hex characters of the hash used in hashed thumbnail filenames.
+THUMBNAIL_HASH_LENGTH = getattr(settings, "THUMBNAIL_HASH_LENGTH", 10)
+# Default upload limits for fields that don't set max_image_pixels or
+# max_decoded_bytes. None means no limit.
+THUMBNAIL_MAX_IMAGE_PIXELS = getattr(settings, "THUMBNAIL_MAX_IMAGE_PIXELS", None)
+THUMBNAIL_MAX_DECODED_BYTES = getattr(settings, "THUMBNAIL_MAX_DECODED_BYTES", None)
+
+
+class ThumbnailDimensions(namedtuple("ThumbnailDimensions", ("width", "height"))):
+    """
+    The (width, height) of a thumbnail. Renders as the width and height
+    attributes of an <img> tag.
+    """
+
+    __slots__ = ()
+
+    def __html__(self):
+        return 'width="%d" height="%d"' % self
+
+    __str__ = __html__
+
+
+UNREADABLE_IMAGE_MESSAGE = (
+    "We were unable to read the uploaded image. "
+    "Please make sure you are uploading a valid image file."
+)
 
 # Models want this instantiated ahead of time.
 IMAGE_EXTENSION_VALIDATOR = ImageUploadExtensionValidator()
@@ -31,53 +81,142 @@ class ImageWithThumbsFieldFile(ImageFieldFile):
     Serves as the file-level storage object for thumbnails.
     """
 
+    @property
+    def thumbnail_storage(self):
+        """
+        The storage backend thumbnails are written to. This is the field's
+        ``thumbnail_storage`` if one was given, otherwise the same storage
+        as the original image.
+        """
+        return self.field.thumbnail_storage or self.storage
+
     def generate_url(
         self, thumb_name, ssl_mode=False, check_cache=True, cache_bust=True
     ):
-        # This is tacked on to the end of the cache key to make sure SSL
-        # URLs are stored separate from plain http.
-        ssl_postfix = "_ssl" if ssl_mode else ""
-
         # Try to see if we can hit the cache instead of asking the storage
         # backend for the URL. This is particularly important for S3 backends.
 
         cache_key = None
 
         if check_cache:
-            cache_key = "Thumbcache_%s_%s%s" % (self.url, thumb_name, ssl_postfix)
-            cache_key = cache_key.strip()
+            cache_key = self.get_url_cache_key(thumb_name, ssl_mode=ssl_mode)
 
             cached_val = cache.get(cache_key)
             if cached_val:
                 return cached_val
 
+        new_url = self.calc_thumb_url(
+            thumb_name, ssl_mode=ssl_mode, cache_bust=cache_bust
+        )
+
+        if cache_key:
+            # Cache this so we don't have to hit the storage backend for a while.
+            cache.set(cache_key, new_url, THUMBNAIL_URL_CACHE_TIME)
+
+        return new_url
+
+    def get_url_cache_key(self, thumb_name, ssl_mode=False):
+        """
+        Returns the cache key generate_url() stores the thumb's URL under.
+        """
+        # This is tacked on to the end of the cache key to make sure SSL
+        # URLs are stored separate from plain http.
+        ssl_postfix = "_ssl" if ssl_mode else ""
+        content_hash = self.get_content_hash()
+        if content_hash:
+            # Hashed thumb URLs change when the content does, even if the
+            # original's URL doesn't (ie: storages that overwrite in place).
+            thumb_name = "%s_%s" % (thumb_name, content_hash)
+        cache_key = "Thumbcache_%s_%s%s" % (self.url, thumb_name, ssl_postfix)
+        return cache_key.strip()
+
+    def calc_thumb_url(self, thumb_name, ssl_mode=False, cache_bust=True):
+        """
+        Assembles the URL for the given thumbnail, without touching the cache.
+        """
         # Determine what the filename would be for a thumb with these
         # dimensions, regardless of whether it actually exists.
         new_filename = self._calc_thumb_filename(thumb_name)
 
-        # Split URL from GET attribs.
-        url_get_split = self.url.rsplit("?", 1)
-        # Just the URL string (no GET attribs).
-        url_str = url_get_split[0]
-        # Get the URL string without the original's filename at the end.
-        url_minus_filename = url_str.rsplit("/", 1)[0]
-
-        # Slap the new thumbnail filename on the end of the old URL, in place
-        # of the orignal image's filename.
-        new_url = "%s/%s" % (url_minus_filename, os.path.basename(new_filename))
-
-        if cache_bust and MEDIA_CACHE_BUSTER:
+        if self.field.thumbnail_storage:
+            # Thumbs live on their own storage, so the URL has to come from
+            # that storage's base URL rather than the original's URL.
+            new_url = self.thumbnail_storage.url(new_filename).rsplit("?", 1)[0]
+        else:
+            # Split URL from GET attribs.
+            url_get_split = self.url.rsplit("?", 1)
+            # Just the URL string (no GET attribs).
+            url_str = url_get_split[0]
+            # Get the URL string without the original's filename at the end.
+            url_minus_filename = url_str.rsplit("/", 1)[0]
+
+            # Slap the new thumbnail filename on the end of the old URL, in
+            # place of the orignal image's filename.
+            new_url = "%s/%s" % (url_minus_filename, os.path.basename(new_filename))
+
+        # Hashed thumbs change names when they change, no busting needed.
+        if cache_bust and MEDIA_CACHE_BUSTER and not self.get_content_hash():
             new_url = "%s?cbust=%s" % (new_url, MEDIA_CACHE_BUSTER)
 
         if ssl_mode:
             new_url = new_url.replace("http://", "https://")
 
-        if cache_key:
-            # Cache this so we don't have to hit the storage backend for a while.
-            cache.set(cache_key, new_url, THUMBNAIL_URL_CACHE_TIME)
-
         return new_url
 
+    def get_url_cache_items(self):
+        """
+        Returns a dict of cache keys to URLs for every thumbnail declared on
+        the field, plain and SSL. This is what generate_url() would cache for
+        this file, and is suitable for handing to cache.set_many().
+        """
+        items = {}
+        for spec in self.field.thumb_specs:
+            for ssl_mode in (False, True):
+                cache_key = self.get_url_cache_key(spec.name, ssl_mode=ssl_mode)
+                items[cache_key] = self.calc_thumb_url(spec.name, ssl_mode=ssl_mode)
+        return items
+
+    def get_original_dimensions(self):
+        """
+        Returns the (width, height) of the original image without going to
+        the storage backend, or None if they aren't known.
+
+        The dimensions come from the field's width_field/height_field, which
+        Django fills in from the uploaded file when it is saved. Failing
+        that, dimensions that have already been read are used.
+        """
+        if self.field.width_field and self.field.height_field:
+            width = getattr(self.instance, self.field.width_field)
+            height = getattr(self.instance, self.field.height_field)
+            if width and height:
+                return width, height
+        dimensions = getattr(self, "_dimensions_cache", None)
+        if dimensions and None not in dimensions:
+            return dimensions
+        return None
+
+    def get_thumbnail_dimensions(self, thumb_name):
+        """
+        Works out the exact dimensions of the given thumbnail from the
+        original's dimensions. This is pure arithmetic, neither the original
+        nor the thumbnail is opened.
+
+        Returns a ThumbnailDimensions, or None if the thumb name isn't
+        declared on the field or the original's dimensions aren't known.
+        """
+        spec = self.field.thumb_specs_by_name.get(thumb_name)
+        original_dimensions = self.get_original_dimensions()
+        if spec is None or original_dimensions is None:
+            return None
+        return ThumbnailDimensions(
+            *calc_thumbnail_size(
+                original_dimensions,
+                spec.size,
+                crop_option=spec.crop_option,
+                upscale=spec.upscale,
+            )
+        )
+
     def get_thumbnail_format(self):
         """
         Determines the target thumbnail type either by looking for a format
@@ -97,28 +236,165 @@ class ImageWithThumbsFieldFile(ImageFieldFile):
         Handles some extra logic to generate the thumbnails when the original
         file is uploaded.
         """
-        super(ImageWithThumbsFieldFile, self).save(name, content, save)
+        previous_name = self.name
+        previous_hash = self.get_content_hash()
+        # Read the image's header before the original is stored, to turn away
+        # images that are too big and to record the dimensions while they're
+        # at hand.
+        content.seek(0)
+        engine = get_engine()
+        try:
+            image = engine.open(content, max_pixels=self.field.get_max_image_pixels())
+        except OSError as exc:
+            raise UploadedImageIsUnreadableError(UNREADABLE_IMAGE_MESSAGE) from exc
+        try:
+            self.check_image_limits(engine, image)
+            dimensions = engine.get_size(image)
+        finally:
+            engine.close(image)
+        # Django re-reads (and often loses) the dimensions while storing the
+        # original, so they're recorded once it's stored, before the instance
+        # is saved.
+        super(ImageWithThumbsFieldFile, self).save(name, content, save=False)
+        self.set_dimensions(dimensions)
+        if self.field.thumbnail_hash_field:
+            # Record the content hash before the instance gets saved.
+            setattr(
+                self.instance,
+                self.field.thumbnail_hash_field,
+                self.calc_content_hash(content),
+            )
+        if save:
+            self.instance.save()
         try:
             self.generate_thumbs(name, content)
         except IOError as exc:
-            if "cannot identify" in exc.message or "bad EPS header" in exc.message:
-                raise UploadedImageIsUnreadableError(
-                    "We were unable to read the uploaded image. "
-                    "Please make sure you are uploading a valid image file."
-                )
+            if "cannot identify" in str(exc) or "bad EPS header" in str(exc):
+                raise UploadedImageIsUnreadableError(UNREADABLE_IMAGE_MESSAGE)
             else:
                 raise
 
+        if (
+            previous_hash
+            and previous_hash != self.get_content_hash()
+            and previous_name == self.name
+        ):
+            # The original was overwritten in place, so its old hashed thumbs
+            # would otherwise be left behind under their old names.
+            self.delete_thumbs(content_hash=previous_hash)
+
+    def set_dimensions(self, dimensions):
+        """
+        Records the original's (width, height) on the instance's
+        width_field/height_field (if the field has them), and on this file, so
+        get_thumbnail_dimensions() doesn't have to go to the storage backend.
+        """
+        self._dimensions_cache = dimensions
+        # Django leaves just the name on the instance after storing the file,
+        # put this file (and its dimensions) back in its place.
+        self.instance.__dict__[self.field.attname] = self
+        if self.field.width_field:
+            setattr(self.instance, self.field.width_field, dimensions[0])
+        if self.field.height_field:
+            setattr(self.instance, self.field.height_field, dimensions[1])
+
+    @staticmethod
+    def calc_content_hash(content):
+        """
+        Returns a hex digest of the uploaded file's contents.
+        """
+        content_hash = hashlib.sha1()
+        for chunk in content.chunks():
+            content_hash.update(chunk)
+        content.seek(0)
+        return content_hash.hexdigest()
+
+    def get_content_hash(self):
+        """
+        Returns the original's recorded content hash if the field has
+        hashed_thumbnails, otherwise None. Thumbs of originals without a
+        recorded hash (ie: uploaded before hashing was turned on) keep their
+        plain filenames until they're regenerated.
+        """
+        if not (self.field.hashed_thumbnails and self.field.thumbnail_hash_field):
+            return None
+        return getattr(self.instance, self.field.thumbnail_hash_field) or None
+
+    def _calc_thumb_hash(self, content_hash, spec_signature, file_extension):
+        """
+        Returns the short hash that goes in a hashed thumbnail's filename.
+        It changes whenever the original's content or the thumb's spec does.
+        """
+        thumb_hash = hashlib.sha1(
+            ("%s|%s|%s" % (content_hash, spec_signature, file_extension)).encode(
+                "utf-8"
+            )
+        )
+        return thumb_hash.hexdigest()[:THUMBNAIL_HASH_LENGTH]
+
+    def check_image_limits(self, engine, image):
+        """
+        Raises UploadedImageTooLargeError if the opened (but not yet decoded)
+        image is over the field's max_image_pixels or max_decoded_bytes.
+        """
+        max_pixels = self.field.get_max_image_pixels()
+        max_bytes = self.field.get_max_decoded_bytes()
+        width, height = engine.get_size(image)
+        if (max_pixels and width * height > max_pixels) or (
+            max_bytes and engine.get_decoded_size(image) > max_bytes
+        ):
+            raise UploadedImageTooLargeError(
+                "The uploaded image is too large (%dx%d). "
+                "Please upload a smaller image." % (width, height)
+            )
+
     def generate_thumbs(self, name, content):
+        for thumb_filename, thumb_content in self.render_thumbs(content):
+            with thumb_content:
+                self.store_thumb(thumb_filename, thumb_content)
+
+    def render_thumbs(self, content):
+        """
+        Creates the field's thumbnails from the original's content, without
+        storing them. Yields (thumb_filename, thumb_content) pairs, one at a
+        time. The caller is responsible for storing (see store_thumb()) and
+        closing each thumb_content.
+        """
         # see http://code.djangoproject.com/ticket/8222 for details
         content.seek(0)
-        with Image.open(content) as image:
-            for thumb in self.field.thumbs:
-                thumb_name, thumb_options = thumb
-                with image.copy() as image_copy:
-                    self.create_and_store_thumb(image_copy, thumb_name, thumb_options)
+        engine = get_engine()
+        image = engine.open(content, max_pixels=self.field.get_max_image_pixels())
+        try:
+            self.check_image_limits(engine, image)
+            source_size = engine.get_size(image)
+            # Decode only as much of the original as the biggest thumb needs.
+            needed_size = source_size
+            if self.field.thumb_specs:
+                scaled_sizes = [
+                    calc_scaled_size(
+                        source_size,
+                        spec.size,
+                        crop_option=spec.crop_option,
+                        upscale=spec.upscale,
+                    )
+                    for spec in self.field.thumb_specs
+                ]
+                needed_size = tuple(map(max, zip(*scaled_sizes)))
+            image = engine.reduce(image, needed_size)
+            file_extension = self.get_thumbnail_format()
+            # Engines never modify the image they're handed, so every thumb
+            # can be made from the same decoded original.
+            for spec in self.field.thumb_specs:
+                yield self.create_thumb(
+                    image,
+                    spec,
+                    source_size=source_size,
+                    file_extension=file_extension,
+                )
+        finally:
+            engine.close(image)
 
-    def _calc_thumb_filename(self, thumb_name):
+    def _calc_thumb_filename(self, thumb_name, file_extension=None, content_hash=None):
         """
         Calculates the correct filename for a would-be (or potentially
         existing) thumbnail of the given size.
@@ -126,71 +402,140 @@ class ImageWithThumbsFieldFile(ImageFieldFile):
         NOTE: This includes the path leading up to the thumbnail. IE:
         uploads/cbid_images/photo.png
 
-        size: (tuple) In the format of (width, height)
+        thumb_name: (str) The name of the thumb, as declared on the field.
+        file_extension: (str) The thumbnail format, if the caller has already
+            worked it out. See get_thumbnail_format().
+        content_hash: (str) The content hash to name hashed thumbs after,
+            if not the original's current one. See get_content_hash().
 
         Returns a string filename.
         """
+        spec = self.field.thumb_specs_by_name.get(thumb_name)
+        # Names that aren't declared on the field still get a would-be
+        # filename, same as always.
+        filename_suffix = spec.filename_suffix if spec else "_%s" % thumb_name
+
         filename_split = self.name.rsplit(".", 1)
         file_name = filename_split[0]
-        file_extension = self.get_thumbnail_format()
+        file_extension = file_extension or self.get_thumbnail_format()
+
+        content_hash = content_hash or self.get_content_hash()
+        if content_hash:
+            spec_signature = spec.signature if spec else thumb_name
+            filename_suffix = "%s.%s" % (
+                filename_suffix,
+                self._calc_thumb_hash(content_hash, spec_signature, file_extension),
+            )
 
-        return "%s_%s.%s" % (file_name, thumb_name, file_extension)
+        return "%s%s.%s" % (file_name, filename_suffix, file_extension)
 
-    def create_and_store_thumb(self, image, thumb_name, thumb_options):
+    def create_and_store_thumb(
+        self, image, spec, thumb_options=None, source_size=None, file_extension=None
+    ):
         """
-        Given that 'image' is a PIL Image object, create a thumbnail for the
-        given size tuple and store it via the storage backend.
-
-        image: (Image) PIL Image object.
-        size: (tuple) Tuple in form of (width, height). Image will be
-            thumbnailed to this size.
+        Given that 'image' was opened by the thumbnail engine, create the
+        thumbnail described by 'spec' and store it via the storage backend.
+        See create_thumb() for the arguments.
+
+        The older (image, thumb_name, thumb_options) form is still accepted,
+        where 'thumb_options' is an options dict like those in the field's
+        thumbs. With no 'thumb_options', the thumb name's declared options
+        are used.
         """
-        size = thumb_options["size"]
-
-        if not isinstance(size, tuple):
-            raise UploadedImageIsUnreadableError(
-                f"incorrect size specifications ${size}"
-            )
-
-        upscale = thumb_options.get("upscale", True)
-        crop = thumb_options.get("crop")
-        crop_option = "center" if crop else None
-
-        thumb_filename = self._calc_thumb_filename(thumb_name)
-        file_extension = self.get_thumbnail_format()
-        pil_format = "jpeg" if file_extension == "jpg" else file_extension
-
-        image = self._create_thumbnail(
-            image, size, crop_option=crop_option, upscale=upscale
+        if not isinstance(spec, ThumbSpec):
+            if thumb_options is not None:
+                spec = ThumbSpec(spec, thumb_options, self.field.thumbnail_format)
+            elif spec in self.field.thumb_specs_by_name:
+                spec = self.field.thumb_specs_by_name[spec]
+            else:
+                raise ThumbnailSpecError(
+                    "%s has no thumb named '%s'" % (self.field, spec)
+                )
+        thumb_filename, thumb_content = self.create_thumb(
+            image, spec, source_size=source_size, file_extension=file_extension
         )
+        with thumb_content:
+            self.store_thumb(thumb_filename, thumb_content)
 
-        with io.BytesIO() as thumbnail:
-            image.save(thumbnail, format=pil_format)
-            thumb_content = ContentFile(thumbnail.getvalue())
-            self.storage.save(thumb_filename, thumb_content)
-
-    @staticmethod
-    def _create_thumbnail(image, size, crop_option=None, upscale=False):
-        from .utils import scale, crop, convert_colorspace
+    def create_thumb(self, image, spec, source_size=None, file_extension=None):
+        """
+        Given that 'image' was opened by the thumbnail engine, create and
+        encode the thumbnail described by 'spec'. Returns a tuple of
+        (thumb_filename, thumb_content), where thumb_content is a File that
+        is ready to be stored and must be closed afterwards.
+
+        image: An image object from the engine (a PIL Image by default).
+        spec: (ThumbSpec) The compiled thumb to create.
+        source_size: (tuple) The original's (width, height), if 'image' was
+            reduced from it.
+        file_extension: (str) The thumbnail format, if the caller has already
+            worked it out. See get_thumbnail_format().
+        """
+        file_extension = (
+            spec.file_extension or file_extension or self.get_thumbnail_format()
+        )
+        thumb_filename = self._calc_thumb_filename(spec.name, file_extension)
+
+        engine = get_engine()
+        image = engine.create_thumbnail(
+            image,
+            spec.size,
+            crop_option=spec.crop_option,
+            upscale=spec.upscale,
+            source_size=source_size,
+        )
 
-        image = convert_colorspace(image, colorspace="RGB")
-        image = scale(image, size, crop_option=crop_option, upscale=upscale)
-        if crop_option:
-            image = crop(image, size, crop_option=crop_option)
-        return image
+        # The engine encodes straight into this buffer, and the storage reads
+        # it back out in chunks. A SpooledTemporaryFile won't do here, since
+        # Pillow asks for fileno() and that always rolls it over to disk.
+        buf = io.BytesIO()
+        engine.encode(image, file_extension, buf)
+        if buf.tell() > THUMBNAIL_SPOOL_MAX_SIZE:
+            # Big thumbs wait for the storage on disk rather than in memory.
+            spooled = tempfile.TemporaryFile()
+            with buf.getbuffer() as view:
+                spooled.write(view)
+            buf.close()
+            buf = spooled
+        buf.seek(0)
+        thumb_content = File(buf, thumb_filename)
+        thumb_content.content_type = mimetypes.guess_type(thumb_filename)[0]
+        if self.get_content_hash():
+            # Picked up by storages that support per-object parameters,
+            # see athumb.storage.
+            thumb_content.object_parameters = {
+                "CacheControl": THUMBNAIL_IMMUTABLE_CACHE_CONTROL,
+                "ContentType": thumb_content.content_type,
+            }
+        return thumb_filename, thumb_content
+
+    def store_thumb(self, thumb_filename, thumb_content):
+        """
+        Writes a thumb from create_thumb() to the thumbnail storage.
+        """
+        self.thumbnail_storage.save(thumb_filename, thumb_content)
 
     def delete(self, save=True):
         """
         Deletes the original, plus any thumbnails. Fails silently if there
         are errors deleting the thumbnails.
         """
-        for thumb in self.field.thumbs:
-            thumb_name, thumb_options = thumb
-            thumb_filename = self._calc_thumb_filename(thumb_name)
-            self.storage.delete(thumb_filename)
-
+        self.delete_thumbs()
         super(ImageWithThumbsFieldFile, self).delete(save)
 
+    def delete_thumbs(self, content_hash=None):
+        """
+        Deletes the original's thumbnails from the thumbnail storage.
+
+        content_hash: (str) Delete the hashed thumbs made for this content
+            hash rather than the current one.
+        """
+        for spec in self.field.thumb_specs:
+            thumb_filename = self._calc_thumb_filename(
+                spec.name, content_hash=content_hash
+            )
+            self.thumbnail_storage.delete(thumb_filename)
+
 
 class ImageWithThumbsField(ImageField):
     """
@@ -200,6 +545,21 @@ class ImageWithThumbsField(ImageField):
 
     Note: The 'thumbs' attribute is not required. If you don't provide it,
     ImageWithThumbsField will act as a normal ImageField
+
+    Thumbnails are stored alongside the original by default. Pass a
+    'thumbnail_storage' (a storage instance or a callable returning one) to
+    write them to a different backend, such as a CDN-backed bucket.
+
+    With 'hashed_thumbnails=True', thumb filenames include a short hash of
+    the original's content and the thumb's spec, so they never change in
+    place and can be cached forever. The content hash is recorded in the
+    CharField(max_length=40) named by 'thumbnail_hash_field', which is
+    required.
+
+    'max_image_pixels' and 'max_decoded_bytes' turn away uploads that would
+    take too much memory to decode. They are checked before decoding, and
+    default to the THUMBNAIL_MAX_IMAGE_PIXELS and THUMBNAIL_MAX_DECODED_BYTES
+    settings.
     """
 
     attr_class = ImageWithThumbsFieldFile
@@ -207,6 +567,22 @@ class ImageWithThumbsField(ImageField):
     def __init__(self, *args, **kwargs):
         self.thumbs = kwargs.pop("thumbs", ())
         self.thumbnail_format = kwargs.pop("thumbnail_format", None)
+        # Validate and compile the thumbs once, up front. Any problems are
+        # reported by the system checks (see _check_thumbs()), and raised on
+        # first use so bad thumbs are never silently skipped.
+        self._thumb_specs, self._thumb_spec_errors = compile_thumb_specs(
+            self.thumbs, self.thumbnail_format
+        )
+        self._thumb_specs_by_name = {spec.name: spec for spec in self._thumb_specs}
+        self.thumbnail_storage = kwargs.pop("thumbnail_storage", None)
+        if callable(self.thumbnail_storage):
+            # Hold on to the callable so deconstruct() can hand it back.
+            self._thumbnail_storage_callable = self.thumbnail_storage
+            self.thumbnail_storage = self.thumbnail_storage()
+        self.hashed_thumbnails = kwargs.pop("hashed_thumbnails", False)
+        self.thumbnail_hash_field = kwargs.pop("thumbnail_hash_field", None)
+        self.max_image_pixels = kwargs.pop("max_image_pixels", None)
+        self.max_decoded_bytes = kwargs.pop("max_decoded_bytes", None)
 
         if "validators" not in kwargs:
             kwargs["validators"] = [IMAGE_EXTENSION_VALIDATOR]
@@ -216,8 +592,100 @@ class ImageWithThumbsField(ImageField):
 
         super(ImageWithThumbsField, self).__init__(*args, **kwargs)
 
+    @property
+    def thumb_specs(self):
+        """
+        The field's compiled ThumbSpecs, in the order they were declared.
+        Raises ThumbnailSpecError if any of the thumbs are invalid.
+        """
+        self._raise_thumb_spec_errors()
+        return self._thumb_specs
+
+    @property
+    def thumb_specs_by_name(self):
+        """
+        The field's compiled ThumbSpecs, keyed by thumb name. Raises
+        ThumbnailSpecError if any of the thumbs are invalid.
+        """
+        self._raise_thumb_spec_errors()
+        return self._thumb_specs_by_name
+
+    def _raise_thumb_spec_errors(self):
+        if self._thumb_spec_errors:
+            raise ThumbnailSpecError(
+                "Invalid thumbs on %s: %s"
+                % (
+                    self,
+                    "; ".join(error.rstrip(".") for error in self._thumb_spec_errors),
+                )
+            )
+
+    def get_max_image_pixels(self):
+        return self.max_image_pixels or THUMBNAIL_MAX_IMAGE_PIXELS
+
+    def get_max_decoded_bytes(self):
+        return self.max_decoded_bytes or THUMBNAIL_MAX_DECODED_BYTES
+
+    def check(self, **kwargs):
+        return [
+            *super(ImageWithThumbsField, self).check(**kwargs),
+            *self._check_thumbs(),
+            *self._check_thumbnail_hash_field(),
+        ]
+
+    def _check_thumbs(self):
+        return [
+            checks.Error(
+                "Invalid thumbs: %s" % error,
+                hint="Thumbs are (name, {'size': (width, height), "
+                "'crop': bool, 'upscale': bool}) tuples.",
+                obj=self,
+                id="athumb.E001",
+            )
+            for error in self._thumb_spec_errors
+        ]
+
+    def _check_thumbnail_hash_field(self):
+        if not self.thumbnail_hash_field:
+            if self.hashed_thumbnails:
+                return [
+                    checks.Error(
+                        "hashed_thumbnails requires a thumbnail_hash_field.",
+                        hint="Add a CharField(max_length=40) to the model for "
+                        "the original's content hash, and name it in "
+                        "thumbnail_hash_field.",
+                        obj=self,
+                        id="athumb.E003",
+                    )
+                ]
+            return []
+        try:
+            self.model._meta.get_field(self.thumbnail_hash_field)
+        except FieldDoesNotExist:
+            return [
+                checks.Error(
+                    "thumbnail_hash_field refers to the nonexistent field '%s'."
+                    % self.thumbnail_hash_field,
+                    obj=self,
+                    id="athumb.E002",
+                )
+            ]
+        return []
+
     def deconstruct(self):
         name, path, args, kwargs = super(ImageWithThumbsField, self).deconstruct()
         kwargs["thumbs"] = self.thumbs
         kwargs["thumbnail_format"] = self.thumbnail_format
+        if self.thumbnail_storage is not None:
+            kwargs["thumbnail_storage"] = getattr(
+                self, "_thumbnail_storage_callable", self.thumbnail_storage
+            )
+        if self.hashed_thumbnails:
+            kwargs["hashed_thumbnails"] = True
+        if self.thumbnail_hash_field:
+            kwargs["thumbnail_hash_field"] = self.thumbnail_hash_field
+        if self.max_image_pixels is not None:
+            kwargs["max_image_pixels"] = self.max_image_pixels
+        if self.max_decoded_bytes is not None:
+            kwargs["max_decoded_bytes"] = self.max_decoded_bytes
         return name, path, args, kwargs
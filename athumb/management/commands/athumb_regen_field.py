@@ -1,7 +1,45 @@
+import ast
+import collections
+import datetime
+import json
 import os
+import threading
+from concurrent import futures
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.exceptions import FieldError, ValidationError
 from django.core.files.base import ContentFile
 from django.core.management.base import BaseCommand, CommandError
 from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from athumb.exceptions import UploadedImageIsUnreadableError
+
+
+class RegenTask(object):
+    """
+    Tracks one instance on its way through the regeneration pipeline.
+    """
+
+    def __init__(self, counter, num_instances, instance):
+        self.counter = counter
+        self.num_instances = num_instances
+        self.instance = instance
+        self.pk = instance.pk
+        self.file = None
+        self.file_name = None
+        # Future for the download stage's result.
+        self.download = None
+        # Set once the task no longer needs the render stage.
+        self.rendered = False
+        # Futures for each thumb being uploaded.
+        self.uploads = []
+        self.failed = False
+        # Set if the failure may go away on a retry (ie: a network error
+        # storing a thumb), as opposed to a corrupt or missing original.
+        self.retry = False
 
 
 class Command(BaseCommand):
@@ -20,11 +58,83 @@ class Command(BaseCommand):
             action="store_true",
             help="Force regeneration of all thumbnails, even if they exist"
         )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Pick up after the last primary key recorded in the checkpoint file",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            help="Path of the checkpoint file. Defaults to "
+            "athumb_regen_<app>_<model>_<field>.checkpoint in the current directory",
+        )
+        parser.add_argument(
+            "--since",
+            help="Only process rows whose --since-field is at or after this "
+            'date or datetime, such as "2024-05-01" or "2024-05-01T03:00"',
+        )
+        parser.add_argument(
+            "--since-field",
+            help='The date/datetime field --since filters on, such as "modified"',
+        )
+        parser.add_argument(
+            "--pk-range",
+            help='Inclusive primary key range in the format of "start:end". '
+            'Either end may be left off, such as "5000:"',
+        )
+        parser.add_argument(
+            "--filter",
+            action="append",
+            default=[],
+            dest="filters",
+            help='A queryset filter in the format of "lookup=value", such as '
+            '"series__slug=foo" or "image__isnull=False". Values that read as '
+            "Python literals (True, None, 5) are passed as such. May be given "
+            "more than once",
+        )
+        parser.add_argument(
+            "--download-workers",
+            type=int,
+            default=4,
+            help="Number of originals to download at once",
+        )
+        parser.add_argument(
+            "--upload-workers",
+            type=int,
+            default=4,
+            help="Number of thumbnails to upload at once",
+        )
+        parser.add_argument(
+            "--queue-size",
+            type=int,
+            default=16,
+            help="Maximum number of downloaded originals, and of rendered "
+            "thumbnails, to hold in memory while they wait their turn",
+        )
 
     def handle(self, *args, **options):
         self.model_name = options["model_name"][0]
         self.field_name = options["field_name"][0]
         self.force_regen = options.get("force", False)
+        self.resume = options.get("resume", False)
+        self.checkpoint_path = options.get("checkpoint")
+        self.since = options.get("since")
+        self.since_field = options.get("since_field")
+        self.pk_range = options.get("pk_range")
+        self.filters = options.get("filters") or []
+        self.download_workers = options.get("download_workers", 4)
+        self.upload_workers = options.get("upload_workers", 4)
+        self.queue_size = options.get("queue_size", 16)
+        # The options that pick which rows get processed. A checkpoint is
+        # only valid for a run with the same ones.
+        self.selection_options = {
+            "model": self.model_name.lower(),
+            "field": self.field_name,
+            "filters": self.filters,
+            "since": self.since,
+            "since_field": self.since_field,
+            "pk_range": self.pk_range,
+        }
 
         self.validate_input()
         self.parse_input()
@@ -33,6 +143,21 @@ class Command(BaseCommand):
     def validate_input(self):
         if "." not in self.model_name:
             raise CommandError("The first argument must be in the format of: app.model")
+        if self.since and not self.since_field:
+            raise CommandError("--since requires --since-field")
+        for option in ("download_workers", "upload_workers", "queue_size"):
+            if getattr(self, option) < 1:
+                raise CommandError(
+                    "--%s must be at least 1" % option.replace("_", "-")
+                )
+        if self.pk_range and ":" not in self.pk_range:
+            raise CommandError("--pk-range must be in the format of: start:end")
+        for expression in self.filters:
+            if "=" not in expression:
+                raise CommandError(
+                    "--filter must be in the format of: lookup=value (got %s)"
+                    % expression
+                )
 
     def parse_input(self):
         """
@@ -53,157 +178,373 @@ class Command(BaseCommand):
         # String field name to re-generate.
         self.field = self.field_name
 
-    def get_missing_thumbnails(self, file_field):
+        if self.since:
+            since = parse_datetime(self.since)
+            if since is None:
+                since_date = parse_date(self.since)
+                if since_date is None:
+                    raise CommandError("Unrecognized --since value: %s" % self.since)
+                since = datetime.datetime.combine(since_date, datetime.time.min)
+            if timezone.is_naive(since) and settings.USE_TZ:
+                since = timezone.make_aware(since)
+            self.since = since
+
+        if not self.checkpoint_path:
+            self.checkpoint_path = "athumb_regen_%s_%s.checkpoint" % (
+                self.model_name.replace(".", "_").lower(),
+                self.field_name,
+            )
+
+    def get_queryset(self):
         """
-        Check which thumbnail variations are missing for a given file field.
-        Returns a list of missing thumbnail names.
+        Builds the queryset of instances to process, narrowed down by any
+        --filter, --since, --pk-range and --resume options. Instances are
+        always walked in primary key order so that checkpoints make sense.
         """
-        if not hasattr(file_field, 'field') or not hasattr(file_field.field, 'thumbs'):
-            return []
+        instances = self.model.objects.all()
+
+        # Each filter is applied on its own, so repeating a lookup narrows
+        # the rows down further instead of replacing the earlier one.
+        filters = []
+        for expression in self.filters:
+            lookup, value = expression.split("=", 1)
+            filters.append((lookup.strip(), self.parse_filter_value(value.strip())))
+        if self.since:
+            filters.append(("%s__gte" % self.since_field, self.since))
+        if self.pk_range:
+            pk_start, pk_end = self.pk_range.split(":", 1)
+            if pk_start:
+                filters.append(("pk__gte", pk_start))
+            if pk_end:
+                filters.append(("pk__lte", pk_end))
+        if self.resume:
+            last_pk = self.read_checkpoint()
+            if last_pk is not None:
+                print("Resuming after ID %s" % last_pk)
+                filters.append(("pk__gt", last_pk))
 
-        missing_thumbs = []
+        try:
+            for lookup, value in filters:
+                instances = instances.filter(**{lookup: value})
+        except (FieldError, ValueError, ValidationError) as exc:
+            raise CommandError("Invalid filter: %s" % exc)
+        return instances.order_by("pk")
+
+    @staticmethod
+    def parse_filter_value(value):
+        """
+        Turns a --filter value into a Python value where it reads as one
+        (ie: True, None, 5), leaving anything else as a string.
+        """
+        try:
+            return ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            return value
+
+    def read_checkpoint(self):
+        """
+        Returns the last completed primary key recorded in the checkpoint
+        file, or None if there is no checkpoint. Refuses to resume from a
+        checkpoint written by a run that selected different rows, since the
+        rows before its primary key weren't necessarily processed.
+        """
+        try:
+            with open(self.checkpoint_path) as checkpoint:
+                data = json.load(checkpoint)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            raise CommandError("Unreadable checkpoint file: %s" % self.checkpoint_path)
+
+        if data.get("options") != self.selection_options:
+            raise CommandError(
+                "The checkpoint in %s was written with different options (%s). "
+                "Re-run with those, or delete the checkpoint to start over."
+                % (self.checkpoint_path, json.dumps(data.get("options")))
+            )
+        return data.get("pk")
 
-        for thumb in file_field.field.thumbs:
-            thumb_name, thumb_options = thumb
-            thumb_filename = file_field._calc_thumb_filename(thumb_name)
+    def write_checkpoint(self, pk):
+        """
+        Records the given primary key as the last one completed, along with
+        the options that selected the rows. The file is swapped into place
+        so a crash mid-write can't leave it truncated.
+        """
+        tmp_path = "%s.tmp" % self.checkpoint_path
+        with open(tmp_path, "w") as checkpoint:
+            json.dump({"pk": str(pk), "options": self.selection_options}, checkpoint)
+        os.replace(tmp_path, self.checkpoint_path)
 
-            print(f"checking thumb - ${thumb_filename}")
+    def download(self, file):
+        """
+        Runs on a download worker. Checks which thumbs are missing (unless
+        --force was given) and fetches the original if any are.
 
-            # Check if the thumbnail file exists in storage
+        Returns a tuple of (status, missing_thumbs, contents), where status
+        is one of 'ok', 'exists' or 'missing'.
+        """
+        missing_thumbs = None
+        if not self.force_regen:
+            missing_thumbs = self.get_missing_thumbnails(file)
+            if not missing_thumbs:
+                return "exists", missing_thumbs, None
+
+        try:
+            fdat = file.read()
+            file.close()
+            del file.file
+        except IOError:
+            return "missing", missing_thumbs, None
+        return "ok", missing_thumbs, fdat
+
+    def render(self, task, upload_pool, upload_slots):
+        """
+        Renders the thumbs for a downloaded original and hands each one to
+        the upload workers, blocking while they're backed up.
+        """
+        status, missing_thumbs, fdat = task.download.result()
+        # Drop the reference so the original's bytes can be freed as soon
+        # as the thumbs are rendered.
+        task.download = None
+        task.rendered = True
+
+        if status == "exists":
+            print(
+                "(%d/%d) ID: %d -- Skipped -- All thumbnails exist for %s"
+                % (task.counter, task.num_instances, task.instance.id, task.file_name)
+            )
+            self.skipped_exists += 1
+            return
+        if status == "missing":
+            # File doesn't exist in storage
+            print(
+                "(%d/%d) ID %d -- Error -- File missing in storage"
+                % (task.counter, task.num_instances, task.instance.id)
+            )
+            self.error_count += 1
+            return
+        if not fdat:
+            # This field has no file content associated with it, skip it.
+            print(
+                "(%d/%d) ID %d -- Skipped -- No file content"
+                % (task.counter, task.num_instances, task.instance.id)
+            )
+            self.skipped_no_file += 1
+            return
+
+        if missing_thumbs:
+            print(
+                "(%d/%d) ID: %d -- Processing %s (missing: %s)"
+                % (
+                    task.counter,
+                    task.num_instances,
+                    task.instance.id,
+                    task.file_name,
+                    ", ".join(missing_thumbs),
+                )
+            )
+        else:
+            action = "Force regenerating" if self.force_regen else "Processing"
+            print(
+                "(%d/%d) ID: %d -- %s %s"
+                % (
+                    task.counter,
+                    task.num_instances,
+                    task.instance.id,
+                    action,
+                    task.file_name,
+                )
+            )
 
+        try:
+            for thumb_filename, thumb_content in task.file.render_thumbs(
+                ContentFile(fdat)
+            ):
+                upload_slots.acquire()
+                future = upload_pool.submit(
+                    self.upload, task.file, thumb_filename, thumb_content
+                )
+                future.add_done_callback(lambda future: upload_slots.release())
+                task.uploads.append(future)
+        except (IOError, UploadedImageIsUnreadableError) as e:
+            print(
+                "(%d/%d) ID %d -- Error -- Image may be corrupt (%s)"
+                % (task.counter, task.num_instances, task.instance.id, str(e))
+            )
+            task.failed = True
 
-            if not file_field.storage.exists(thumb_filename):
-                print(f"\tmissing thumb - ${thumb_filename}")
-                missing_thumbs.append(thumb_name)
-            else:
-                print(f"\tthumb found - ${thumb_filename}")
+    def upload(self, file, thumb_filename, thumb_content):
+        """
+        Runs on an upload worker, storing one rendered thumb.
+        """
+        with thumb_content:
+            file.store_thumb(thumb_filename, thumb_content)
 
-        return missing_thumbs
+    def flush_completed(self, pending):
+        """
+        Tallies up and checkpoints the oldest tasks, for as long as they have
+        finished. Tasks finish out of order, so the checkpoint only moves
+        past a task once it and every task before it are done.
+
+        The checkpoint stops moving at the first task that failed in a way
+        worth retrying (ie: an IOError storing a thumb), so that --resume
+        picks up from there. Upload errors other than IOError are raised
+        here, which also leaves the checkpoint before the failed task.
+        """
+        while pending:
+            task = pending[0]
+            if not task.rendered or not all(f.done() for f in task.uploads):
+                return
+            pending.popleft()
+
+            for future in task.uploads:
+                try:
+                    future.result()
+                except IOError as e:
+                    print(
+                        "(%d/%d) ID %d -- Error -- Unable to store thumbnail (%s)"
+                        % (task.counter, task.num_instances, task.instance.id, str(e))
+                    )
+                    task.failed = task.retry = True
+                    break
+
+            if task.failed:
+                self.error_count += 1
+            elif task.uploads:
+                self.processed_count += 1
+            if task.retry:
+                self.checkpoint_held = True
+            if not self.checkpoint_held:
+                self.write_checkpoint(task.pk)
+
+    def clear_checkpoint(self):
+        try:
+            os.remove(self.checkpoint_path)
+        except FileNotFoundError:
+            pass
 
-    def needs_regeneration(self, file_field):
+    def get_missing_thumbnails(self, file_field):
         """
-        Determine if thumbnails need to be regenerated for this file field.
-        Returns True if any thumbnails are missing or if force mode is enabled.
+        Check which thumbnail variations are missing for a given file field.
+        Returns a list of missing thumbnail names.
         """
-        if self.force_regen:
-            return True
+        if not hasattr(file_field, 'field') or not hasattr(file_field.field, 'thumb_specs'):
+            return []
 
-        missing_thumbs = self.get_missing_thumbnails(file_field)
-        return len(missing_thumbs) > 0
+        missing_thumbs = []
+
+        # This runs on the download workers, so nothing is printed here. The
+        # missing thumbs are reported with the rest of the row's output.
+        for spec in file_field.field.thumb_specs:
+            thumb_filename = file_field._calc_thumb_filename(spec.name)
+            if not file_field.thumbnail_storage.exists(thumb_filename):
+                missing_thumbs.append(spec.name)
+
+        return missing_thumbs
 
     def regenerate_thumbs(self):
         """
         Handle re-generating the thumbnails. Only regenerates when thumbnails
         are missing or when --force is used.
+
+        This runs as a pipeline so the network and CPU stay busy at the same
+        time: originals are prefetched by --download-workers threads,
+        thumbnails are rendered here in the main thread, and then written by
+        --upload-workers threads. At most --queue-size originals and
+        --queue-size rendered thumbs are held in memory at any one time.
         """
-        Model = self.model
-        instances = Model.objects.all()
+        instances = self.get_queryset()
         num_instances = instances.count()
+        if not self.resume:
+            # A checkpoint from an earlier run doesn't apply to this one.
+            self.clear_checkpoint()
 
-        processed_count = 0
-        skipped_no_file = 0
-        skipped_exists = 0
-        error_count = 0
+        # Set once a task fails in a way worth retrying, see flush_completed().
+        self.checkpoint_held = False
+        self.processed_count = 0
+        self.skipped_no_file = 0
+        self.skipped_exists = 0
+        self.error_count = 0
 
         # Filenames are keys in here, to help avoid re-genning something that
         # we have already done in this run.
         regen_tracker = {}
 
-        counter = 1
-        for instance in instances:
-            file = getattr(instance, self.field)
-            if not file:
-                print(
-                    "(%d/%d) ID: %d -- Skipped -- No file"
-                    % (counter, num_instances, instance.id)
-                )
-                skipped_no_file += 1
-                counter += 1
-                continue
-
-            file_name = os.path.basename(file.name)
-
-            if file_name in regen_tracker:
-                print(
-                    "(%d/%d) ID: %d -- Skipped -- Already processed %s"
-                    % (counter, num_instances, instance.id, file_name)
-                )
-                skipped_exists += 1
-                counter += 1
-                continue
-
-            if not self.needs_regeneration(file):
-                missing_thumbs = self.get_missing_thumbnails(file)
-                if not missing_thumbs:
+        # Every task in queryset order, until it's finished and checkpointed.
+        pending = collections.deque()
+        # Tasks whose originals are being (or have been) downloaded, waiting
+        # to be rendered.
+        downloads = collections.deque()
+        # Bounds the number of rendered thumbs waiting on an upload worker.
+        upload_slots = threading.BoundedSemaphore(self.queue_size)
+
+        with ThreadPoolExecutor(
+            max_workers=self.download_workers
+        ) as download_pool, ThreadPoolExecutor(
+            max_workers=self.upload_workers
+        ) as upload_pool:
+            for counter, instance in enumerate(instances.iterator(), start=1):
+                task = RegenTask(counter, num_instances, instance)
+                pending.append(task)
+
+                file = getattr(instance, self.field)
+                if not file:
                     print(
-                        "(%d/%d) ID: %d -- Skipped -- All thumbnails exist for %s"
-                        % (counter, num_instances, instance.id, file_name)
+                        "(%d/%d) ID: %d -- Skipped -- No file"
+                        % (counter, num_instances, instance.id)
                     )
-                    skipped_exists += 1
-                    regen_tracker[file_name] = True
-                    counter += 1
-                    continue
+                    self.skipped_no_file += 1
+                    task.rendered = True
                 else:
-                    print(
-                        "(%d/%d) ID: %d -- Processing %s (missing: %s)"
-                        % (counter, num_instances, instance.id, file_name, ", ".join(missing_thumbs))
-                    )
-            else:
-                action = "Force regenerating" if self.force_regen else "Processing"
-                print(
-                    "(%d/%d) ID: %d -- %s %s"
-                    % (counter, num_instances, instance.id, action, file_name)
-                )
-
-            try:
-                fdat = file.read()
-                file.close()
-                del file.file
-            except IOError:
-                # File doesn't exist in storage
-                print(
-                    "(%d/%d) ID %d -- Error -- File missing in storage"
-                    % (counter, num_instances, instance.id)
-                )
-                error_count += 1
-                counter += 1
-                continue
-
-            try:
-                file_contents = ContentFile(fdat)
-            except ValueError:
-                # This field has no file associated with it, skip it.
-                print(
-                    "(%d/%d) ID %d -- Skipped -- No file content"
-                    % (counter, num_instances, instance.id)
-                )
-                skipped_no_file += 1
-                counter += 1
-                continue
-
-            # Saving pumps it back through the thumbnailer, if this is a
-            # ThumbnailField. If not, it's still pretty harmless.
-            try:
-                file.generate_thumbs(file_name, file_contents)
-                processed_count += 1
-            except IOError as e:
-                print(
-                    "(%d/%d) ID %d -- Error -- Image may be corrupt (%s)"
-                    % (counter, num_instances, instance.id, str(e))
-                )
-                error_count += 1
-                counter += 1
-                continue
-
-            regen_tracker[file_name] = True
-            counter += 1
+                    file_name = os.path.basename(file.name)
+                    if file_name in regen_tracker:
+                        print(
+                            "(%d/%d) ID: %d -- Skipped -- Already processed %s"
+                            % (counter, num_instances, instance.id, file_name)
+                        )
+                        self.skipped_exists += 1
+                        task.rendered = True
+                    else:
+                        regen_tracker[file_name] = True
+                        task.file = file
+                        task.file_name = file_name
+                        task.download = download_pool.submit(self.download, file)
+                        downloads.append(task)
+
+                # Render whatever has arrived. Once the prefetch queue is
+                # full, wait on the oldest download so it can't grow further.
+                while downloads and (
+                    len(downloads) >= self.queue_size or downloads[0].download.done()
+                ):
+                    self.render(downloads.popleft(), upload_pool, upload_slots)
+                self.flush_completed(pending)
+
+            while downloads:
+                self.render(downloads.popleft(), upload_pool, upload_slots)
+                self.flush_completed(pending)
+
+            for task in pending:
+                futures.wait(task.uploads)
+            self.flush_completed(pending)
+
+        if not self.checkpoint_held:
+            # Made it through everything, a later --resume should start over.
+            self.clear_checkpoint()
 
         print("\nREGENERATION SUMMARY:")
         print(f"\tTotal instances: {num_instances}")
-        print(f"\tProcessed (regenerated): {processed_count}")
-        print(f"\tSkipped (no file): {skipped_no_file}")
-        print(f"\tSkipped (thumbnails exist): {skipped_exists}")
-        print(f"\tErrors: {error_count}")
+        print(f"\tProcessed (regenerated): {self.processed_count}")
+        print(f"\tSkipped (no file): {self.skipped_no_file}")
+        print(f"\tSkipped (thumbnails exist): {self.skipped_exists}")
+        print(f"\tErrors: {self.error_count}")
+
+        if self.checkpoint_held:
+            print(
+                "\nNote: Some thumbnails couldn't be stored. Run again with "
+                "--resume to retry from the first of them"
+            )
 
         if self.force_regen:
             print("\nNote: --force was used, all thumbnails were regenerated")
@@ -0,0 +1,157 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.contenttypes.models import ContentType
+
+from athumb.fields import THUMBNAIL_URL_CACHE_TIME, ImageWithThumbsField
+
+
+class Command(BaseCommand):
+    args = "<app.model> <field>"
+    help = (
+        "Pre-computes and caches the thumbnail URLs for all instances of the "
+        "given model, for the given field."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "model_name", nargs=1, help='The model, such as "learn.Series"'
+        )
+        parser.add_argument(
+            "field_name", nargs=1, help='The field name, such as "image"'
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Number of rows per chunk. Each chunk's URLs are written "
+            "to the cache with a single set_many call",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=1,
+            help="Number of chunks to compute and cache at once",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            help="Only warm the first N rows (see --order-by)",
+        )
+        parser.add_argument(
+            "--order-by",
+            action="append",
+            default=[],
+            help='Field to order rows by, such as "--order-by=-views" (the "=" '
+            "is needed for descending fields). Combine with --limit to warm just "
+            "the hottest rows. May be given more than once",
+        )
+
+    def handle(self, *args, **options):
+        self.model_name = options["model_name"][0]
+        self.field_name = options["field_name"][0]
+        self.chunk_size = options["chunk_size"]
+        self.concurrency = options["concurrency"]
+        self.limit = options.get("limit")
+        self.order_by = options.get("order_by") or ["pk"]
+
+        self.validate_input()
+        self.parse_input()
+        self.warm_cache()
+
+    def validate_input(self):
+        if "." not in self.model_name:
+            raise CommandError("The first argument must be in the format of: app.model")
+        if self.chunk_size < 1:
+            raise CommandError("--chunk-size must be at least 1")
+        if self.concurrency < 1:
+            raise CommandError("--concurrency must be at least 1")
+
+    def parse_input(self):
+        """
+        Go through the user input, get/validate some important values.
+        """
+        app, model_name = self.model_name.split(".", 1)
+
+        try:
+            self.model = ContentType.objects.get(
+                app_label=app, model=model_name.lower()
+            ).model_class()
+        except ContentType.DoesNotExist:
+            raise CommandError(
+                "There is no app/model combination: %s" % self.model_name
+            )
+
+        try:
+            field = self.model._meta.get_field(self.field_name)
+        except FieldDoesNotExist:
+            raise CommandError(
+                "%s has no field named %s" % (self.model_name, self.field_name)
+            )
+        if not isinstance(field, ImageWithThumbsField):
+            raise CommandError(
+                "%s.%s is not an ImageWithThumbsField"
+                % (self.model_name, self.field_name)
+            )
+
+    def get_queryset(self):
+        instances = (
+            self.model.objects.exclude(**{self.field_name: ""})
+            .exclude(**{"%s__isnull" % self.field_name: True})
+            .order_by(*self.order_by)
+        )
+        if self.limit:
+            instances = instances[: self.limit]
+        return instances
+
+    def iter_chunks(self, instances):
+        """
+        Yields lists of up to --chunk-size instances.
+        """
+        chunk = []
+        for instance in instances.iterator(chunk_size=self.chunk_size):
+            chunk.append(instance)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def warm_chunk(self, chunk):
+        """
+        Computes every thumb URL for the chunk and caches them in one go.
+        Returns the number of URLs cached.
+        """
+        cache_items = {}
+        for instance in chunk:
+            cache_items.update(getattr(instance, self.field_name).get_url_cache_items())
+        cache.set_many(cache_items, THUMBNAIL_URL_CACHE_TIME)
+        return len(cache_items)
+
+    def warm_cache(self):
+        instances = self.get_queryset()
+        num_instances = instances.count()
+
+        num_rows = 0
+        num_urls = 0
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            # Don't queue up more chunks than the workers can chew on, or a
+            # huge table ends up sitting in memory.
+            pending = []
+            for chunk in self.iter_chunks(instances):
+                pending.append((len(chunk), executor.submit(self.warm_chunk, chunk)))
+                if len(pending) >= self.concurrency * 2:
+                    chunk_len, future = pending.pop(0)
+                    num_urls += future.result()
+                    num_rows += chunk_len
+                    print("(%d/%d) Cached %d URLs" % (num_rows, num_instances, num_urls))
+            for chunk_len, future in pending:
+                num_urls += future.result()
+                num_rows += chunk_len
+                print("(%d/%d) Cached %d URLs" % (num_rows, num_instances, num_urls))
+
+        print("\nWARM-UP SUMMARY:")
+        print(f"\tInstances: {num_rows}")
+        print(f"\tURLs cached: {num_urls}")
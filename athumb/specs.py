@@ -0,0 +1,130 @@
+"""
+Compiled thumbnail specifications.
+
+An ImageWithThumbsField's ``thumbs`` are given as ``(name, options)`` tuples.
+These are validated and turned into ThumbSpec objects once, when the field is
+constructed, so nothing has to be looked up or checked again per upload.
+"""
+
+from athumb.exceptions import ThumbnailSpecError
+
+# Keys allowed in a thumb's options dict.
+THUMB_OPTIONS = ("size", "crop", "upscale")
+
+
+class ThumbSpec(object):
+    """
+    An immutable, validated entry from a field's ``thumbs``.
+
+    name: (str) The thumb's name, as used in templates.
+    size: (tuple) In the format of (width, height).
+    crop_option: (str) The cropping option to pass to the engine, or None
+        if the thumb isn't cropped.
+    upscale: (bool) Whether images smaller than ``size`` are enlarged.
+    filename_suffix: (str) Appended to the original's filename (minus the
+        extension) to get the thumb's filename.
+    file_extension: (str) The forced thumbnail format, or None if thumbs
+        take the format of the uploaded file.
+    signature: (str) Everything about the spec that affects the thumb's
+        pixels, used in hashed thumbnail filenames.
+    """
+
+    __slots__ = (
+        "name",
+        "size",
+        "crop_option",
+        "upscale",
+        "filename_suffix",
+        "file_extension",
+        "signature",
+    )
+
+    def __init__(self, name, options, thumbnail_format=None):
+        if not isinstance(name, str) or not name:
+            raise ThumbnailSpecError("Thumb names must be non-empty strings: %r" % name)
+        if not isinstance(options, dict):
+            raise ThumbnailSpecError(
+                "Options for thumb '%s' must be a dict, not %r" % (name, options)
+            )
+
+        unknown = sorted(set(options) - set(THUMB_OPTIONS))
+        if unknown:
+            raise ThumbnailSpecError(
+                "Unknown option(s) for thumb '%s': %s" % (name, ", ".join(unknown))
+            )
+
+        size = options.get("size")
+        if (
+            not isinstance(size, (tuple, list))
+            or len(size) != 2
+            or not all(
+                isinstance(dim, int) and not isinstance(dim, bool) and dim > 0
+                for dim in size
+            )
+        ):
+            raise ThumbnailSpecError(
+                "Thumb '%s' needs a 'size' in the format of (width, height), "
+                "got %r" % (name, size)
+            )
+
+        set_attr = super(ThumbSpec, self).__setattr__
+        set_attr("name", name)
+        set_attr("size", tuple(size))
+        set_attr("crop_option", "center" if options.get("crop") else None)
+        set_attr("upscale", bool(options.get("upscale", True)))
+        set_attr("filename_suffix", "_%s" % name)
+        set_attr(
+            "file_extension", thumbnail_format.lower() if thumbnail_format else None
+        )
+        set_attr(
+            "signature",
+            "%s:%dx%d:%s:%d"
+            % (name, self.size[0], self.size[1], self.crop_option or "", self.upscale),
+        )
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ThumbSpec objects are immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("ThumbSpec objects are immutable")
+
+    def __repr__(self):
+        return "<ThumbSpec %s %dx%d%s>" % (
+            self.name,
+            self.size[0],
+            self.size[1],
+            " cropped" if self.crop_option else "",
+        )
+
+
+def compile_thumb_specs(thumbs, thumbnail_format=None):
+    """
+    Compiles a field's ``thumbs`` into ThumbSpec objects.
+
+    Returns a tuple of (specs, errors), where ``specs`` is a tuple of every
+    valid ThumbSpec and ``errors`` is a list of messages for the invalid
+    entries. Errors are handed back instead of raised so they can be
+    reported through Django's system checks.
+    """
+    specs = []
+    errors = []
+    seen_names = set()
+    for thumb in thumbs:
+        try:
+            thumb_name, thumb_options = thumb
+            spec = ThumbSpec(thumb_name, thumb_options, thumbnail_format)
+        except (TypeError, ValueError) as exc:
+            errors.append(
+                "Thumbs must be (name, options) tuples, got %r (%s)" % (thumb, exc)
+            )
+            continue
+        except ThumbnailSpecError as exc:
+            errors.append(str(exc))
+            continue
+
+        if spec.name in seen_names:
+            errors.append("Thumb name '%s' is used more than once." % spec.name)
+            continue
+        seen_names.add(spec.name)
+        specs.append(spec)
+    return tuple(specs), errors
@@ -0,0 +1,30 @@
+"""
+Storage backends that understand the per-object parameters athumb attaches
+to thumbnails, such as the Cache-Control header sent with hashed thumbs.
+"""
+
+from storages.backends.s3 import S3Storage
+
+
+class ThumbnailObjectParametersMixin(object):
+    """
+    Merges the 'object_parameters' athumb sets on a thumbnail's content into
+    the parameters the object is written with. Mix this in ahead of any
+    django-storages backend that has _get_write_parameters().
+    """
+
+    def _get_write_parameters(self, name, content=None):
+        params = super(ThumbnailObjectParametersMixin, self)._get_write_parameters(
+            name, content
+        )
+        params.update(getattr(content, "object_parameters", None) or {})
+        return params
+
+
+class S3ThumbnailStorage(ThumbnailObjectParametersMixin, S3Storage):
+    """
+    An S3 storage suitable for a field's 'thumbnail_storage', that uploads
+    hashed thumbs with long-lived Cache-Control headers.
+    """
+
+    pass
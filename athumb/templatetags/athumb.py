@@ -1,6 +1,7 @@
 from django.template import Library
-from .thumbnail import thumbnail
+from .thumbnail import thumbnail, thumbnail_dimensions
 
 register = Library()
 
 register.tag(thumbnail)
+register.simple_tag(thumbnail_dimensions)
@@ -221,3 +221,29 @@ def thumbnail(parser, token):
 
 
 register.tag(thumbnail)
+
+
+@register.simple_tag
+def thumbnail_dimensions(source, thumb_name):
+    """
+    Returns the dimensions of a thumbnail, worked out from the original's
+    recorded dimensions without touching the storage backend. The field
+    needs width_field and height_field for this to work.
+
+    Used on its own, this renders the width and height attributes::
+
+        <img src="{% thumbnail image '80x80' %}" {% thumbnail_dimensions image '80x80' %} />
+
+    Or put the dimensions on the context::
+
+        {% thumbnail_dimensions image '80x80' as dims %}
+        <img src="{% thumbnail image '80x80' %}" width="{{ dims.width }}" height="{{ dims.height }}" />
+
+    Renders nothing if the dimensions aren't known.
+    """
+    try:
+        dimensions = source.get_thumbnail_dimensions(thumb_name.strip())
+    except AttributeError:
+        # Not an ImageWithThumbsFieldFile, or no file at all.
+        return ""
+    return dimensions or ""
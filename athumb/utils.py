@@ -111,20 +111,65 @@ def convert_colorspace(image, colorspace):
     return image
 
 
-def crop(image, target_size, crop_option="center"):
-    x_image, y_image = map(float, image.size)
-    x_offset, y_offset = parse_crop(crop_option, (x_image, y_image), target_size)
-    return image.crop(
-        (x_offset, y_offset, target_size[0] + x_offset, target_size[1] + y_offset)
+def calc_scaled_size(image_size, target_size, crop_option=None, upscale=False):
+    """
+    Calculates the dimensions an image of the given size ends up with after
+    being scaled towards ``target_size``. This is pure arithmetic, no image
+    needs to be loaded.
+
+    :param tuple image_size: The (x,y) dimensions of the source image.
+    :param tuple target_size: The (x,y) dimensions of the thumbnail.
+    :param str crop_option: If given, the image is scaled to cover the target
+        size (so it can be cropped after), instead of fitting inside it.
+    :param bool upscale: Whether images smaller than the target are enlarged.
+    :rtype: tuple of ints
+    :returns: The (x,y) dimensions after scaling. This is ``image_size`` when
+        no scaling is needed.
+    """
+    x_image, y_image = map(float, image_size)
+    factors = (target_size[0] / x_image, target_size[1] / y_image)
+    factor = max(factors) if crop_option else min(factors)
+    if factor < 1 or upscale:
+        return round_to_int(x_image * factor), round_to_int(y_image * factor)
+    return int(x_image), int(y_image)
+
+
+def calc_thumbnail_size(image_size, target_size, crop_option=None, upscale=False):
+    """
+    Calculates the exact dimensions of a thumbnail made from an image of the
+    given size, following the same rules as scale() and crop(). No image
+    needs to be loaded.
+
+    :rtype: tuple of ints
+    :returns: The (x,y) dimensions of the finished thumbnail.
+    """
+    if crop_option:
+        # Cropping always yields the full window, padding if the scaled
+        # image came up short (when upscaling is off).
+        return int(target_size[0]), int(target_size[1])
+    return calc_scaled_size(
+        image_size, target_size, crop_option=crop_option, upscale=upscale
     )
 
 
+def calc_crop_box(image_size, target_size, crop_option="center"):
+    """
+    Calculates the (left, upper, right, lower) box to crop an image of the
+    given size down to ``target_size``.
+    """
+    x_image, y_image = map(float, image_size)
+    x_offset, y_offset = parse_crop(crop_option, (x_image, y_image), target_size)
+    return (x_offset, y_offset, target_size[0] + x_offset, target_size[1] + y_offset)
+
+
+def crop(image, target_size, crop_option="center"):
+    return image.crop(calc_crop_box(image.size, target_size, crop_option=crop_option))
+
+
 def scale(image, target_size, crop_option=None, upscale=False):
-    x_image, y_image = map(float, image.size)
-    factors = (target_size[0] / x_image, target_size[1] / y_image)
-    factor = max(factors) if crop_option else min(factors)
-    if factor < 1 or upscale:
-        width = round_to_int(x_image * factor)
-        height = round_to_int(y_image * factor)
-        image = image.resize((width, height), resample=Image.Resampling.LANCZOS)
+    size = calc_scaled_size(
+        image.size, target_size, crop_option=crop_option, upscale=upscale
+    )
+    if size != image.size:
+        image = image.resize(size, resample=Image.Resampling.LANCZOS)
     return image
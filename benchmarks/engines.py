@@ -0,0 +1,121 @@
+"""
+Compares the available thumbnail engines on identical inputs.
+
+Run from the repository root::
+
+    python benchmarks/engines.py [--repeat N] [--size WIDTHxHEIGHT]
+
+Each engine gets the same originals and makes the same set of thumbs, going
+through the same steps as an upload: open, reduce, create and encode.
+"""
+
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+settings.configure(INSTALLED_APPS=["athumb"])
+django.setup()
+
+from PIL import Image  # noqa: E402
+
+from athumb.engines import get_engine  # noqa: E402
+from athumb.utils import calc_scaled_size  # noqa: E402
+
+ENGINES = (
+    "athumb.engines.pil.PILEngine",
+    "athumb.engines.vips.VipsEngine",
+)
+
+# (size, crop_option, upscale), as a typical field might declare.
+THUMBS = (
+    ((50, 50), "center", True),
+    ((60, 60), None, True),
+    ((120, 1000), None, True),
+    ((200, 1000), None, True),
+    ((640, 640), None, False),
+)
+
+
+def make_originals(size):
+    """
+    Returns {name: (file_extension, bytes)} of noisy test originals, so the
+    encoders can't take shortcuts on flat colour.
+    """
+    image = Image.merge(
+        "RGB", [Image.effect_noise(size, 64 + 32 * band) for band in range(3)]
+    )
+    originals = {}
+    for name, file_extension, pil_format, mode in (
+        ("jpeg", "jpg", "JPEG", "RGB"),
+        ("png", "png", "PNG", "RGB"),
+        ("png-rgba", "png", "PNG", "RGBA"),
+    ):
+        buf = io.BytesIO()
+        image.convert(mode).save(buf, format=pil_format)
+        originals[name] = (file_extension, buf.getvalue())
+    return originals
+
+
+def make_thumbs(engine, file_extension, data):
+    image = engine.open(io.BytesIO(data))
+    try:
+        source_size = engine.get_size(image)
+        scaled_sizes = [
+            calc_scaled_size(source_size, size, crop_option=crop, upscale=upscale)
+            for size, crop, upscale in THUMBS
+        ]
+        image = engine.reduce(image, tuple(map(max, zip(*scaled_sizes))))
+        for size, crop, upscale in THUMBS:
+            thumb = engine.create_thumbnail(
+                image, size, crop_option=crop, upscale=upscale, source_size=source_size
+            )
+            engine.encode(thumb, file_extension, io.BytesIO())
+    finally:
+        engine.close(image)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--size", default="4000x3000")
+    options = parser.parse_args()
+    size = tuple(int(dim) for dim in options.size.split("x"))
+
+    originals = make_originals(size)
+    print("%d thumbs from %dx%d originals, best/median of %d runs\n"
+          % (len(THUMBS), size[0], size[1], options.repeat))
+    print("%-30s %-10s %10s %10s" % ("engine", "input", "best (s)", "median (s)"))
+
+    for path in ENGINES:
+        try:
+            engine = get_engine(path)
+        except Exception as exc:
+            print("%-30s skipped: %s" % (path.rsplit(".", 1)[-1], exc))
+            continue
+        for name, (file_extension, data) in originals.items():
+            timings = []
+            for _ in range(options.repeat):
+                start = time.perf_counter()
+                make_thumbs(engine, file_extension, data)
+                timings.append(time.perf_counter() - start)
+            print(
+                "%-30s %-10s %10.3f %10.3f"
+                % (
+                    path.rsplit(".", 1)[-1],
+                    name,
+                    min(timings),
+                    statistics.median(timings),
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
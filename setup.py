@@ -9,6 +9,7 @@ setup(
     version=athumb.VERSION,
     packages=[
         "athumb",
+        "athumb.engines",
         "athumb.management",
         "athumb.management.commands",
         "athumb.templatetags",
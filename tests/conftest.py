@@ -0,0 +1,55 @@
+import django
+import pytest
+from django.conf import settings
+from django.db import transaction
+from django.test.utils import override_settings
+
+
+def pytest_configure():
+    if not settings.configured:
+        settings.configure(
+            SECRET_KEY="athumb-tests",
+            INSTALLED_APPS=["django.contrib.contenttypes", "athumb", "tests"],
+            DATABASES={
+                "default": {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"}
+            },
+            DEFAULT_AUTO_FIELD="django.db.models.AutoField",
+            MEDIA_URL="http://media.example.com/",
+        )
+        django.setup()
+
+        from django.core.management import call_command
+
+        call_command("migrate", run_syncdb=True, verbosity=0)
+
+
+@pytest.fixture
+def db():
+    """
+    Runs the test in a transaction that is rolled back afterwards.
+    """
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+@pytest.fixture
+def media(tmp_path):
+    """
+    Points MEDIA_ROOT, where the test models store files, at a fresh
+    directory.
+    """
+    with override_settings(MEDIA_ROOT=str(tmp_path)):
+        yield tmp_path
+
+
+
+@pytest.fixture
+def clear_cache():
+    """
+    Starts the test with an empty cache, so thumbnail URLs cached by other
+    tests (for files of the same name) aren't picked up.
+    """
+    from django.core.cache import cache
+
+    cache.clear()
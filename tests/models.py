@@ -0,0 +1,46 @@
+from django.core.files.storage import FileSystemStorage
+from django.db import models
+
+from athumb.fields import ImageWithThumbsField
+
+THUMBS = (
+    ("50x50_cropped", {"size": (50, 50), "crop": True}),
+    ("60x60", {"size": (60, 60)}),
+)
+
+
+class Photo(models.Model):
+    image = ImageWithThumbsField(
+        upload_to="photos",
+        thumbs=THUMBS,
+        width_field="w",
+        height_field="h",
+        blank=True,
+    )
+    w = models.IntegerField(null=True)
+    h = models.IntegerField(null=True)
+    modified = models.DateTimeField(auto_now=True)
+    slug = models.CharField(max_length=50, blank=True)
+
+
+class CdnPhoto(models.Model):
+    image = ImageWithThumbsField(
+        upload_to="photos",
+        thumbs=THUMBS,
+        # Stores under MEDIA_ROOT like the originals, but served from its own
+        # base URL.
+        thumbnail_storage=FileSystemStorage(base_url="http://cdn.example.com/t/"),
+    )
+
+
+class HashedPhoto(models.Model):
+    image = ImageWithThumbsField(
+        upload_to="photos",
+        # Re-uploads replace the original in place, like S3 with
+        # file_overwrite=True.
+        storage=FileSystemStorage(allow_overwrite=True),
+        thumbs=THUMBS,
+        hashed_thumbnails=True,
+        thumbnail_hash_field="image_hash",
+    )
+    image_hash = models.CharField(max_length=40, blank=True)
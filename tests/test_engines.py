@@ -0,0 +1,151 @@
+"""
+Runs the same thumbnailing checks against every available engine. Engines
+whose imaging library isn't installed are skipped.
+"""
+
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+
+from athumb.engines import get_engine
+from athumb.engines.vips import pyvips
+from athumb.exceptions import UploadedImageTooLargeError
+from athumb.utils import calc_thumbnail_size
+
+ENGINES = [
+    "athumb.engines.pil.PILEngine",
+    pytest.param(
+        "athumb.engines.vips.VipsEngine",
+        marks=pytest.mark.skipif(pyvips is None, reason="pyvips is not installed"),
+    ),
+]
+
+# (file extension, Pillow format, Pillow mode) of the originals to test with.
+SOURCES = [
+    ("jpg", "JPEG", "RGB"),
+    ("png", "PNG", "RGBA"),
+    ("gif", "GIF", "P"),
+]
+
+# (size, crop_option, upscale) of the thumbs to make.
+SPECS = [
+    ((50, 50), "center", True),
+    ((60, 60), None, True),
+    ((1000, 1000), None, True),
+    ((2000, 2000), None, False),
+    ((40, 300), "center", False),
+]
+
+SOURCE_SIZE = (301, 199)
+
+
+def make_original(pil_format, mode):
+    image = Image.linear_gradient("L").resize(SOURCE_SIZE).convert(mode)
+    buf = io.BytesIO()
+    image.save(buf, format=pil_format)
+    buf.seek(0)
+    return buf
+
+
+@pytest.fixture(params=ENGINES)
+def engine(request):
+    return get_engine(request.param)
+
+
+@pytest.mark.parametrize("file_extension, pil_format, mode", SOURCES)
+@pytest.mark.parametrize("size, crop_option, upscale", SPECS)
+def test_thumbnail_dimensions(
+    engine, file_extension, pil_format, mode, size, crop_option, upscale
+):
+    image = engine.open(make_original(pil_format, mode))
+    try:
+        assert tuple(engine.get_size(image)) == SOURCE_SIZE
+        thumb = engine.create_thumbnail(
+            image, size, crop_option=crop_option, upscale=upscale
+        )
+        buf = io.BytesIO()
+        engine.encode(thumb, file_extension, buf)
+    finally:
+        engine.close(image)
+
+    buf.seek(0)
+    with Image.open(buf) as encoded:
+        assert encoded.format == pil_format
+        assert encoded.size == calc_thumbnail_size(
+            SOURCE_SIZE, size, crop_option=crop_option, upscale=upscale
+        )
+
+
+def test_close_leaves_content_open(engine):
+    buf = make_original("PNG", "RGB")
+    image = engine.open(buf)
+    image = engine.reduce(image, (10, 10))
+    engine.close(image)
+    assert not buf.closed
+    buf.seek(0)
+    assert buf.read(4) == b"\x89PNG"
+
+
+@pytest.mark.parametrize("mode", ["P", "1", "I;16"])
+def test_reduce_unsupported_modes(engine, mode):
+    # Big enough that the original is reduced on the way to the thumb.
+    source_size = (1200, 900)
+    source = Image.linear_gradient("L").resize(source_size).convert(mode)
+    buf = io.BytesIO()
+    source.save(buf, format="PNG")
+    buf.seek(0)
+
+    image = engine.open(buf)
+    try:
+        image = engine.reduce(image, (60, 45))
+        assert engine.get_size(image)[0] < source_size[0]
+        thumb = engine.create_thumbnail(image, (60, 60), source_size=source_size)
+    finally:
+        engine.close(image)
+    assert tuple(engine.get_size(thumb)) == calc_thumbnail_size(source_size, (60, 60))
+
+
+def test_pil_decompression_bomb(monkeypatch):
+    engine = get_engine("athumb.engines.pil.PILEngine")
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+    buf = make_original("PNG", "RGB")
+
+    with pytest.raises(UploadedImageTooLargeError):
+        engine.open(buf)
+
+    # A field that allows bigger images than Pillow's limit can open them.
+    buf.seek(0)
+    image = engine.open(buf, max_pixels=SOURCE_SIZE[0] * SOURCE_SIZE[1])
+    assert image.size == SOURCE_SIZE
+    engine.close(image)
+    assert Image.MAX_IMAGE_PIXELS == 1000
+
+
+def test_pil_limit_not_shared_between_threads(monkeypatch):
+    engine = get_engine("athumb.engines.pil.PILEngine")
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+    pil_open = Image.open
+
+    def slow_open(fp):
+        # Widen the window in which another thread could change the limit.
+        time.sleep(0.002)
+        return pil_open(fp)
+
+    monkeypatch.setattr(Image, "open", slow_open)
+
+    def opens(max_pixels):
+        original = make_original("PNG", "RGB")
+        try:
+            engine.close(engine.open(original, max_pixels=max_pixels))
+        except UploadedImageTooLargeError:
+            return False
+        return True
+
+    # Opens without a field limit never see a limit raised by another thread.
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(opens, [None, 10**6] * 50))
+    assert results == [False, True] * 50
+    assert Image.MAX_IMAGE_PIXELS == 1000
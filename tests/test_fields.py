@@ -0,0 +1,241 @@
+"""
+Tests for ImageWithThumbsField and its FieldFile, saving through the test
+models onto a FileSystemStorage.
+"""
+
+import io
+import os
+import re
+from unittest import mock
+
+import pytest
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import models
+from django.test.utils import isolate_apps
+from PIL import Image
+
+from athumb.exceptions import ThumbnailSpecError, UploadedImageIsUnreadableError
+from athumb.fields import ImageWithThumbsField, ImageWithThumbsFieldFile
+from tests.models import CdnPhoto, HashedPhoto, Photo
+
+pytestmark = pytest.mark.usefixtures("db", "media", "clear_cache")
+
+
+def make_upload(name="photo.png", size=(301, 199), color="red"):
+    buf = io.BytesIO()
+    Image.new("RGB", size, color).save(buf, format="PNG")
+    return SimpleUploadedFile(name, buf.getvalue(), content_type="image/png")
+
+
+def thumb_exists(file, thumb_name):
+    return file.thumbnail_storage.exists(file._calc_thumb_filename(thumb_name))
+
+
+def test_model_save_with_upload():
+    photo = Photo(image=make_upload())
+    photo.save()
+
+    photo = Photo.objects.get(pk=photo.pk)
+    assert photo.image.storage.exists(photo.image.name)
+    assert (photo.w, photo.h) == (301, 199)
+    assert thumb_exists(photo.image, "50x50_cropped")
+    assert thumb_exists(photo.image, "60x60")
+    with photo.image.thumbnail_storage.open(
+        photo.image._calc_thumb_filename("60x60")
+    ) as thumb, Image.open(thumb) as image:
+        assert image.size == (60, 40)
+
+
+def test_field_file_save_records_dimensions():
+    photo = Photo()
+    photo.image.save("photo.png", make_upload(), save=False)
+    assert (photo.w, photo.h) == (301, 199)
+    assert photo.image.get_thumbnail_dimensions("60x60") == (60, 40)
+
+    photo.save()
+    photo = Photo.objects.get(pk=photo.pk)
+    assert (photo.w, photo.h) == (301, 199)
+
+
+def test_unreadable_upload():
+    upload = SimpleUploadedFile("photo.png", b"not an image", content_type="image/png")
+    photo = Photo()
+    with pytest.raises(UploadedImageIsUnreadableError):
+        photo.image.save("photo.png", upload)
+    assert not photo.pk
+
+
+def test_thumb_urls():
+    photo = Photo.objects.create(image=make_upload())
+    assert (
+        photo.image.generate_url("60x60")
+        == "http://media.example.com/photos/photo_60x60.png"
+    )
+    assert (
+        photo.image.generate_url("50x50_cropped", ssl_mode=True)
+        == "https://media.example.com/photos/photo_50x50_cropped.png"
+    )
+
+
+def test_thumbnail_storage():
+    photo = CdnPhoto.objects.create(image=make_upload())
+    thumb_filename = photo.image._calc_thumb_filename("60x60")
+    assert photo.image.thumbnail_storage is CdnPhoto._meta.get_field(
+        "image"
+    ).thumbnail_storage
+    assert photo.image.thumbnail_storage.exists(thumb_filename)
+    assert (
+        photo.image.generate_url("60x60")
+        == "http://cdn.example.com/t/photos/photo_60x60.png"
+    )
+
+    photo.image.delete()
+    assert not photo.image.thumbnail_storage.exists(thumb_filename)
+
+
+def test_url_cache_items_match_generate_url():
+    photo = Photo.objects.create(image=make_upload())
+    items = photo.image.get_url_cache_items()
+    assert len(items) == 4
+    for spec in photo.image.field.thumb_specs:
+        for ssl_mode in (False, True):
+            cache_key = photo.image.get_url_cache_key(spec.name, ssl_mode=ssl_mode)
+            assert items[cache_key] == photo.image.generate_url(
+                spec.name, ssl_mode=ssl_mode, check_cache=False
+            )
+
+
+def test_warm_cache_fills_generate_url_keys(capsys):
+    photos = [Photo.objects.create(image=make_upload()) for _ in range(3)]
+    cache.clear()
+    call_command("athumb_warm_cache", "tests.Photo", "image", "--chunk-size=2")
+    assert "URLs cached: 12" in capsys.readouterr().out
+
+    for photo in photos:
+        for cache_key, url in photo.image.get_url_cache_items().items():
+            assert cache.get(cache_key) == url
+    with mock.patch.object(
+        ImageWithThumbsFieldFile, "calc_thumb_url", side_effect=AssertionError
+    ):
+        assert photos[0].image.generate_url("60x60") == (
+            "http://media.example.com/photos/%s"
+            % os.path.basename(photos[0].image._calc_thumb_filename("60x60"))
+        )
+
+
+def test_hashed_thumbnails():
+    photo = HashedPhoto.objects.create(image=make_upload())
+    assert len(photo.image_hash) == 40
+
+    thumb_filename = photo.image._calc_thumb_filename("60x60")
+    assert re.fullmatch(r"photos/photo_60x60\.[0-9a-f]{10}\.png", thumb_filename)
+    assert photo.image.thumbnail_storage.exists(thumb_filename)
+    # Each thumb's options go into its hash.
+    assert (
+        photo.image._calc_thumb_filename("50x50_cropped").rsplit(".", 2)[1]
+        != thumb_filename.rsplit(".", 2)[1]
+    )
+    # Hashed thumbs aren't cache busted.
+    with mock.patch("athumb.fields.MEDIA_CACHE_BUSTER", "v2"):
+        assert "cbust" not in photo.image.calc_thumb_url("60x60")
+
+    thumb = photo.image.create_thumb(
+        Image.new("RGB", (301, 199)), photo.image.field.thumb_specs_by_name["60x60"]
+    )[1]
+    with thumb:
+        assert "immutable" in thumb.object_parameters["CacheControl"]
+        assert thumb.object_parameters["ContentType"] == "image/png"
+
+
+def test_hashed_thumbnails_without_recorded_hash():
+    photo = HashedPhoto.objects.create(image=make_upload())
+    photo.image_hash = ""
+    assert photo.image._calc_thumb_filename("60x60") == "photos/photo_60x60.png"
+    with mock.patch("athumb.fields.MEDIA_CACHE_BUSTER", "v2"):
+        assert photo.image.calc_thumb_url("60x60").endswith("?cbust=v2")
+
+
+def test_hashed_thumbnails_overwritten_original():
+    photo = HashedPhoto.objects.create(image=make_upload())
+    old_thumbs = [
+        photo.image._calc_thumb_filename(spec.name)
+        for spec in photo.image.field.thumb_specs
+    ]
+    old_cache_key = photo.image.get_url_cache_key("60x60")
+    old_url = photo.image.generate_url("60x60")
+
+    photo.image.save("photo.png", make_upload(color="blue"))
+    assert photo.image.name == "photos/photo.png"
+    new_thumbs = [
+        photo.image._calc_thumb_filename(spec.name)
+        for spec in photo.image.field.thumb_specs
+    ]
+    storage = photo.image.thumbnail_storage
+    assert not any(storage.exists(name) for name in old_thumbs)
+    assert all(storage.exists(name) for name in new_thumbs)
+    # The original's URL didn't change, but the cached thumb URL must.
+    assert photo.image.get_url_cache_key("60x60") != old_cache_key
+    assert photo.image.generate_url("60x60") != old_url
+
+
+@isolate_apps("tests")
+def test_check_invalid_thumbs():
+    class BadThumbs(models.Model):
+        image = ImageWithThumbsField(
+            thumbs=(("a", {"size": (10, 10)}), ("a", {"size": (20, 20)}))
+        )
+
+        class Meta:
+            app_label = "tests"
+
+    field = BadThumbs._meta.get_field("image")
+    assert [error.id for error in field.check()] == ["athumb.E001"]
+    with pytest.raises(ThumbnailSpecError):
+        field.thumb_specs
+
+
+@isolate_apps("tests")
+def test_check_thumbnail_hash_field():
+    class MissingHashField(models.Model):
+        image = ImageWithThumbsField(
+            hashed_thumbnails=True, thumbnail_hash_field="image_hash"
+        )
+
+        class Meta:
+            app_label = "tests"
+
+    class NoHashField(models.Model):
+        image = ImageWithThumbsField(hashed_thumbnails=True)
+
+        class Meta:
+            app_label = "tests"
+
+    assert [
+        error.id for error in MissingHashField._meta.get_field("image").check()
+    ] == ["athumb.E002"]
+    assert [error.id for error in NoHashField._meta.get_field("image").check()] == [
+        "athumb.E003"
+    ]
+    assert HashedPhoto._meta.get_field("image").check() == []
+
+
+def test_create_and_store_thumb_by_name():
+    photo = Photo.objects.create(image=make_upload())
+    storage = photo.image.thumbnail_storage
+    image = Image.new("RGB", (301, 199))
+
+    for args in (
+        ("60x60",),
+        ("60x60", {"size": (60, 60)}),
+        (photo.image.field.thumb_specs_by_name["60x60"],),
+    ):
+        storage.delete(photo.image._calc_thumb_filename("60x60"))
+        photo.image.create_and_store_thumb(image, *args)
+        assert storage.exists(photo.image._calc_thumb_filename("60x60"))
+
+    with pytest.raises(ThumbnailSpecError):
+        photo.image.create_and_store_thumb(image, "nope")
+    with pytest.raises(ThumbnailSpecError):
+        photo.image.create_and_store_thumb(image, "60x60", {"size": "big"})
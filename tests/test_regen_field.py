@@ -0,0 +1,272 @@
+"""
+Tests for the athumb_regen_field management command, run against the test
+models on a FileSystemStorage.
+"""
+
+import datetime
+import io
+import json
+import re
+import threading
+from unittest import mock
+
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from PIL import Image
+
+from athumb.fields import ImageWithThumbsFieldFile
+from athumb.management.commands.athumb_regen_field import Command
+from tests.models import Photo
+
+pytestmark = pytest.mark.usefixtures("db", "media")
+
+
+def make_photos(count, **kwargs):
+    photos = []
+    for index in range(count):
+        buf = io.BytesIO()
+        Image.new("RGB", (301, 199), (index * 10, 0, 0)).save(buf, format="PNG")
+        upload = SimpleUploadedFile("photo%d.png" % index, buf.getvalue())
+        photos.append(Photo.objects.create(image=upload, **kwargs))
+    return photos
+
+
+def delete_thumbs(photo):
+    for spec in photo.image.field.thumb_specs:
+        photo.image.thumbnail_storage.delete(
+            photo.image._calc_thumb_filename(spec.name)
+        )
+
+
+def thumbs_exist(photo):
+    return all(
+        photo.image.thumbnail_storage.exists(
+            photo.image._calc_thumb_filename(spec.name)
+        )
+        for spec in photo.image.field.thumb_specs
+    )
+
+
+@pytest.fixture
+def checkpoint(tmp_path):
+    return tmp_path / "regen.checkpoint"
+
+
+@pytest.fixture
+def regen(checkpoint, capsys):
+    """
+    Runs the command on Photo.image and returns the IDs it printed, in order.
+    """
+
+    def run(*args):
+        call_command(
+            "athumb_regen_field",
+            "tests.Photo",
+            "image",
+            "--checkpoint",
+            str(checkpoint),
+            *args,
+        )
+        output = capsys.readouterr().out
+        run.output = output
+        return [int(pk) for pk in re.findall(r"^\(\d+/\d+\) ID:? (\d+)", output, re.M)]
+
+    return run
+
+
+def test_regenerates_missing_thumbs(regen, checkpoint):
+    photos = make_photos(3)
+    delete_thumbs(photos[1])
+
+    regen()
+    assert thumbs_exist(photos[1])
+    assert "Processed (regenerated): 1" in regen.output
+    assert "Skipped (thumbnails exist): 2" in regen.output
+    assert not checkpoint.exists()
+
+
+def test_checkpoints_in_order(regen, checkpoint):
+    photos = make_photos(4)
+    pks = [photo.pk for photo in photos]
+    last_row_done = threading.Event()
+    upload = Command.upload
+    finished = []
+
+    def slow_first_row(self, file, thumb_filename, thumb_content):
+        if file.instance.pk == pks[0]:
+            # Hold the first row's uploads until the last row's are done.
+            assert last_row_done.wait(timeout=10)
+        upload(self, file, thumb_filename, thumb_content)
+        finished.append(file.instance.pk)
+        if finished.count(pks[-1]) == 2:
+            last_row_done.set()
+
+    with mock.patch.object(Command, "upload", slow_first_row), mock.patch.object(
+        Command, "write_checkpoint", autospec=True, side_effect=Command.write_checkpoint
+    ) as write_checkpoint:
+        regen("--force", "--upload-workers", "4")
+
+    # The last row finished first, but was checkpointed last.
+    assert finished.index(pks[-1]) < finished.index(pks[0])
+    assert [call.args[1] for call in write_checkpoint.call_args_list] == pks
+    assert "Processed (regenerated): 4" in regen.output
+    assert not checkpoint.exists()
+
+
+def test_queues_are_bounded(regen):
+    make_photos(8)
+    queue_size = 2
+    lock = threading.Lock()
+    counts = {"downloaded": 0, "rendered": 0, "thumbs": 0, "uploaded": 0}
+    peaks = {"downloads": 0, "thumbs": 0}
+    download, render, upload = Command.download, Command.render, Command.upload
+    render_thumbs = ImageWithThumbsFieldFile.render_thumbs
+
+    def counting_download(self, file):
+        result = download(self, file)
+        with lock:
+            counts["downloaded"] += 1
+            peaks["downloads"] = max(
+                peaks["downloads"], counts["downloaded"] - counts["rendered"]
+            )
+        return result
+
+    def counting_render(self, task, upload_pool, upload_slots):
+        with lock:
+            counts["rendered"] += 1
+        return render(self, task, upload_pool, upload_slots)
+
+    def counting_render_thumbs(self, content):
+        for thumb in render_thumbs(self, content):
+            with lock:
+                counts["thumbs"] += 1
+                peaks["thumbs"] = max(
+                    peaks["thumbs"], counts["thumbs"] - counts["uploaded"]
+                )
+            yield thumb
+
+    def slow_upload(self, file, thumb_filename, thumb_content):
+        threading.Event().wait(0.01)
+        upload(self, file, thumb_filename, thumb_content)
+        with lock:
+            counts["uploaded"] += 1
+
+    with mock.patch.multiple(
+        Command, download=counting_download, render=counting_render, upload=slow_upload
+    ), mock.patch.object(
+        ImageWithThumbsFieldFile, "render_thumbs", counting_render_thumbs
+    ):
+        regen("--force", "--queue-size", str(queue_size), "--download-workers", "4")
+
+    assert counts["uploaded"] == 16
+    assert peaks["downloads"] <= queue_size
+    # The next thumb is rendered before waiting for an upload slot.
+    assert peaks["thumbs"] <= queue_size + 1
+
+
+def test_upload_error_holds_checkpoint(regen, checkpoint):
+    photos = make_photos(4)
+    pks = [photo.pk for photo in photos]
+    for photo in photos:
+        delete_thumbs(photo)
+    upload = Command.upload
+
+    def failing_upload(self, file, thumb_filename, thumb_content):
+        if file.instance.pk == pks[1]:
+            raise IOError("connection reset")
+        upload(self, file, thumb_filename, thumb_content)
+
+    with mock.patch.object(Command, "upload", failing_upload):
+        regen()
+    assert "Errors: 1" in regen.output
+    assert "--resume" in regen.output
+    # Later rows were done, but the checkpoint stays before the failed one.
+    assert thumbs_exist(photos[3])
+    assert json.loads(checkpoint.read_text())["pk"] == str(pks[0])
+
+    assert regen("--resume") == pks[1:]
+    assert "Resuming after ID %d" % pks[0] in regen.output
+    assert "Processed (regenerated): 1" in regen.output
+    assert thumbs_exist(photos[1])
+    assert not checkpoint.exists()
+
+
+def test_resume_refuses_other_options(regen, checkpoint):
+    photos = make_photos(2)
+    upload = Command.upload
+
+    def failing_upload(self, file, thumb_filename, thumb_content):
+        if file.instance.pk == photos[1].pk:
+            raise IOError("connection reset")
+        upload(self, file, thumb_filename, thumb_content)
+
+    with mock.patch.object(Command, "upload", failing_upload):
+        regen("--force", "--pk-range", "%d:" % photos[0].pk)
+    assert checkpoint.exists()
+
+    with pytest.raises(CommandError, match="different options"):
+        regen("--force", "--resume")
+    assert regen("--force", "--resume", "--pk-range", "%d:" % photos[0].pk) == [
+        photos[1].pk
+    ]
+
+
+def test_unreadable_checkpoint(regen, checkpoint):
+    make_photos(1)
+    checkpoint.write_text("5")
+    with pytest.raises(CommandError, match="Unreadable checkpoint"):
+        regen("--resume")
+
+
+def test_run_without_resume_discards_checkpoint(regen, checkpoint):
+    photos = make_photos(2)
+    checkpoint.write_text("5")
+
+    def failing_upload(self, file, thumb_filename, thumb_content):
+        raise IOError("connection reset")
+
+    # Nothing gets checkpointed, and the old checkpoint would skip rows.
+    with mock.patch.object(Command, "upload", failing_upload):
+        regen("--force")
+    assert not checkpoint.exists()
+    assert regen("--force", "--resume") == [photo.pk for photo in photos]
+
+
+def test_filters(regen):
+    photos = make_photos(4, slug="a") + make_photos(2, slug="b")
+    pks = [photo.pk for photo in photos]
+
+    assert regen("--force", "--filter", "slug=a") == pks[:4]
+    # Repeated lookups narrow the rows down further.
+    assert regen(
+        "--force", "--filter", "pk__gte=%d" % pks[1], "--filter", "pk__gte=%d" % pks[2]
+    ) == pks[2:]
+    assert regen(
+        "--force", "--filter", "image__isnull=False", "--filter", "slug=b"
+    ) == pks[4:]
+    assert regen("--force", "--pk-range", "%d:%d" % (pks[1], pks[3])) == pks[1:4]
+    assert regen("--force", "--pk-range", "%d:" % pks[4]) == pks[4:]
+
+
+def test_since(regen):
+    old, new = make_photos(2)
+    Photo.objects.filter(pk=old.pk).update(
+        modified=datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+    )
+
+    assert regen("--force", "--since", "2021-01-01", "--since-field", "modified") == [
+        new.pk
+    ]
+    with pytest.raises(CommandError):
+        regen("--since", "2021-01-01")
+    with pytest.raises(CommandError):
+        regen("--since", "yesterday", "--since-field", "modified")
+
+
+@pytest.mark.parametrize("expression", ["pk=abc", "nope=1", "modified__gte=notadate"])
+def test_invalid_filter(regen, expression):
+    make_photos(1)
+    with pytest.raises(CommandError, match="Invalid filter"):
+        regen("--filter", expression)